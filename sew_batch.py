@@ -0,0 +1,201 @@
+"""Convert saved drawings to embroidery files without the viewer
+
+Usage:
+    python sew_batch.py                       # every drawing in SewCustom/
+    python sew_batch.py "SewCustom/drawing_2025*.json" -f pes,dst -j 8
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from sew_format import is_drawing_file
+from sew_model import (BUILD_SETTINGS, DEFAULT_SCALE, WRITERS, export_formats,
+                       load_drawing_file, plan_for)
+from sew_plan import describe_report
+
+SEW_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SewCustom')
+
+# Remembers which source content each output was built from
+MANIFEST_NAME = '.sew_batch.manifest'
+
+def file_hash(path):
+    """SHA-1 of a file's bytes, matching Drawing.content_hash"""
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def output_path(source, output_dir, fmt):
+    base_name = os.path.splitext(os.path.basename(source))[0]
+    folder = output_dir or os.path.dirname(source)
+    return os.path.abspath(os.path.join(folder, f'{base_name}.{fmt}'))
+
+def is_up_to_date(source, target, source_hash, manifest, scale, settings):
+    """True if target exists and was built from this source content
+
+    The manifest entry decides when there is one, so a touched-but-
+    unchanged drawing is skipped and a new scale or settings are not;
+    outputs the manifest does not know are up to date if newer than the
+    source.
+    """
+    if not os.path.exists(target):
+        return False
+    entry = manifest.get(target)
+    if entry is not None:
+        return entry == manifest_entry(source_hash, scale, settings)
+    return os.path.getmtime(target) >= os.path.getmtime(source)
+
+def manifest_entry(source_hash, scale, settings):
+    """What the manifest records for an output, as it reads back from JSON"""
+    return [source_hash, scale, dict(sorted(settings.items()))]
+
+def convert_file(source, targets, scale, settings):
+    """Worker: convert one drawing to each (format, path) in targets"""
+    start = time.perf_counter()
+    drawing = load_drawing_file(source)
+    points = sum(len(stroke.coordinates) for stroke in drawing.strokes)
+    timings = export_formats(drawing, dict(targets), scale=scale,
+                             settings=settings)
+    _, report = plan_for(drawing, scale, settings)
+    return {
+        'hash': drawing.content_hash,
+        'points': points,
+        'timings': timings,
+        'report': report,
+        'seconds': time.perf_counter() - start,
+    }
+
+def load_manifest(folder):
+    try:
+        with open(os.path.join(folder, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(folder, manifest):
+    path = os.path.join(folder, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+
+def collect_sources(patterns):
+    """Expand glob patterns (or the SewCustom folder) to drawing paths"""
+    if not patterns:
+        patterns = [SEW_FOLDER]
+    sources = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            sources.update(os.path.join(pattern, name) for name in os.listdir(pattern)
+                           if is_drawing_file(name))
+        else:
+            sources.update(glob.glob(pattern))
+    return sorted(sources)
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Convert saved drawings to embroidery files in parallel')
+    parser.add_argument('inputs', nargs='*',
+                        help='drawing files (.json or .sewb), folders or glob '
+                             'patterns (default: SewCustom/)')
+    parser.add_argument('-f', '--formats', default='pes',
+                        help='comma-separated formats: ' + ','.join(WRITERS)
+                             + ' (default: pes)')
+    parser.add_argument('-o', '--output-dir',
+                        help='write outputs here instead of next to each drawing')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='worker processes (default: CPU count)')
+    parser.add_argument('-s', '--scale', type=float, default=DEFAULT_SCALE,
+                        help=f'pixels to 0.1mm units (default: {DEFAULT_SCALE})')
+    parser.add_argument('--force', action='store_true',
+                        help='convert even if outputs are up to date')
+    parser.add_argument('--no-optimize', action='store_true',
+                        help='keep the drawn stroke order instead of grouping '
+                             'colors and minimizing jumps')
+    args = parser.parse_args(argv)
+
+    args.settings = dict(BUILD_SETTINGS, group_colors=not args.no_optimize,
+                         optimize_order=not args.no_optimize)
+
+    args.formats = [fmt.strip().lower() for fmt in args.formats.split(',') if fmt.strip()]
+    unknown = [fmt for fmt in args.formats if fmt not in WRITERS]
+    if unknown:
+        parser.error(f'unknown format(s): {", ".join(unknown)}')
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    sources = collect_sources(args.inputs)
+    if not sources:
+        print('No drawings found')
+        return 1
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    # Work out what actually needs converting
+    manifests = {}
+    jobs = {}
+    skipped = 0
+    for source in sources:
+        source_hash = file_hash(source)
+        targets = []
+        for fmt in args.formats:
+            target = output_path(source, args.output_dir, fmt)
+            folder = os.path.dirname(target)
+            manifest = manifests.setdefault(folder, load_manifest(folder))
+            if args.force or not is_up_to_date(source, target, source_hash,
+                                               manifest, args.scale, args.settings):
+                targets.append((fmt, target))
+        if targets:
+            jobs[source] = targets
+        else:
+            skipped += 1
+
+    print(f'🧵 {len(sources)} drawing(s): {len(jobs)} to convert, '
+          f'{skipped} up to date, {args.jobs} worker(s)')
+
+    converted = failed = total_points = 0
+    start = time.perf_counter()
+    if jobs:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            futures = {pool.submit(convert_file, source, targets, args.scale,
+                                   args.settings): source
+                       for source, targets in jobs.items()}
+            for future in as_completed(futures):
+                source = futures[future]
+                name = os.path.basename(source)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f'  ❌ {name}: {e}')
+                    continue
+                converted += 1
+                total_points += result['points']
+                for fmt, target in jobs[source]:
+                    manifests[os.path.dirname(target)][target] = manifest_entry(
+                        result['hash'], args.scale, args.settings)
+                formats = ' '.join(f'{fmt}={seconds:.2f}s'
+                                   for fmt, seconds in result['timings'].items())
+                print(f'  ✅ {name}: {result["points"]} points '
+                      f'in {result["seconds"]:.2f}s ({formats})')
+                for line in describe_report(result['report']):
+                    print(f'     {line}')
+
+        for folder, manifest in manifests.items():
+            save_manifest(folder, manifest)
+
+    elapsed = time.perf_counter() - start
+    print('=' * 60)
+    print(f'Converted {converted}, skipped {skipped}, failed {failed} '
+          f'in {elapsed:.2f}s')
+    if converted and elapsed > 0:
+        print(f'Throughput: {converted / elapsed:.1f} drawings/s, '
+              f'{total_points / elapsed:,.0f} points/s')
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
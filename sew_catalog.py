@@ -0,0 +1,263 @@
+"""SQLite catalog of the drawings in a folder
+
+Listing tens of thousands of drawings with os.listdir and sorting the
+names on every request is slow, and says nothing about what is in each
+file. The catalog keeps one row per drawing (size, mtime, timestamp,
+stroke and point counts, bounding box, content hash) in a database
+inside the folder. It is updated when the server saves a drawing and
+reconciled incrementally otherwise: only new or changed files are
+parsed, and the folder is not scanned at all while its mtime is
+unchanged.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from sew_format import is_drawing_file
+from sew_model import load_drawing_file
+
+CATALOG_NAME = '.sew_catalog.sqlite'
+
+# Files that do not parse yet and were written in the last SETTLE_SECONDS
+# are taken to be incomplete (still being written or copied in) and are
+# tried again on a later pass
+SETTLE_SECONDS = 1.0
+
+# Columns /list_drawings may sort by
+SORT_COLUMNS = ('filename', 'mtime', 'timestamp', 'size', 'strokes', 'points')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS drawings (
+    filename TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    timestamp TEXT,
+    strokes INTEGER NOT NULL,
+    points INTEGER NOT NULL,
+    min_x REAL, min_y REAL, max_x REAL, max_y REAL,
+    content_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS drawings_mtime ON drawings (mtime_ns);
+CREATE INDEX IF NOT EXISTS drawings_timestamp ON drawings (timestamp);
+CREATE INDEX IF NOT EXISTS drawings_hash ON drawings (content_hash);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value INTEGER
+);
+CREATE TABLE IF NOT EXISTS unreadable (
+    filename TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+'''
+
+FIELDS = ('filename', 'size', 'mtime_ns', 'timestamp', 'strokes', 'points',
+          'min_x', 'min_y', 'max_x', 'max_y', 'content_hash')
+
+def describe(path, drawing=None):
+    """Catalog row for a drawing file, parsing it unless drawing is given"""
+    stat = os.stat(path)
+    if drawing is None:
+        drawing = load_drawing_file(path)
+    if len(drawing.points):
+        min_x, min_y = np.asarray(drawing.points).min(axis=0).tolist()
+        max_x, max_y = np.asarray(drawing.points).max(axis=0).tolist()
+    else:
+        min_x = min_y = max_x = max_y = None
+    return (os.path.basename(path), stat.st_size, stat.st_mtime_ns,
+            drawing.timestamp, len(drawing.source_strokes), len(drawing.points),
+            min_x, min_y, max_x, max_y, drawing.content_hash)
+
+class Catalog:
+    """Drawing metadata for one folder, kept in CATALOG_NAME inside it"""
+    def __init__(self, folder):
+        self.folder = folder
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(folder, CATALOG_NAME),
+                                  timeout=10, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        with self.lock, self.db:
+            # The server and the viewer may both have the catalog open
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def add(self, path, drawing=None):
+        """Insert or refresh the row for one drawing file"""
+        row = describe(path, drawing)
+        with self.lock, self.db:
+            self._upsert([row])
+
+    def add_all(self, saved):
+        """Insert or refresh rows for (path, drawing) pairs in one commit
+
+        Files that are gone or unreadable by now are left for reconcile.
+        """
+        rows = []
+        for path, drawing in saved:
+            try:
+                rows.append(describe(path, drawing))
+            except (OSError, ValueError):
+                continue
+        with self.lock, self.db:
+            self._upsert(rows)
+
+    def _upsert(self, rows):
+        self.db.executemany(
+            f'INSERT OR REPLACE INTO drawings ({", ".join(FIELDS)}) '
+            f'VALUES ({", ".join("?" * len(FIELDS))})', rows)
+
+    def reconcile(self, force=False, settle=0):
+        """Bring the catalog in line with the folder
+
+        Files whose size and mtime match their row are not opened. While
+        the folder's own mtime is unchanged no file can have been added,
+        removed or atomically replaced, so the scan is skipped unless
+        force is set. A file that cannot be read but was modified less than
+        settle seconds ago is probably still being written; it is left out
+        and reported as pending so the caller can look again. Older
+        unreadable files are remembered and not tried again until their
+        size or mtime changes; since writing into a file does not touch
+        the folder's mtime, they are checked even when the scan is
+        skipped. Returns lists of the file names (added or updated,
+        removed, pending).
+        """
+        folder_mtime = os.stat(self.folder).st_mtime_ns
+        with self.lock:
+            row = self.db.execute(
+                "SELECT value FROM state WHERE key = 'folder_mtime_ns'").fetchone()
+            bad = {name: (size, mtime) for name, size, mtime in self.db.execute(
+                'SELECT filename, size, mtime_ns FROM unreadable')}
+            if (not force and row is not None and row[0] == folder_mtime
+                    and not self._rewritten(bad)):
+                return [], [], []
+            known = {name: (size, mtime) for name, size, mtime in self.db.execute(
+                'SELECT filename, size, mtime_ns FROM drawings')}
+
+        changed = []
+        present = set()
+        pending = []
+        broken = []
+        recent = time.time_ns() - int(settle * 1e9)
+        for entry in os.scandir(self.folder):
+            if not entry.is_file() or not is_drawing_file(entry.name):
+                continue
+            present.add(entry.name)
+            stat = entry.stat()
+            key = (stat.st_size, stat.st_mtime_ns)
+            if known.get(entry.name) == key or bad.get(entry.name) == key:
+                continue
+            try:
+                changed.append(describe(entry.path))
+            except (OSError, ValueError):
+                # Keep any old row. A file written just now is probably
+                # half-written, so look again on a later pass; anything
+                # older is corrupt and skipped until it changes
+                if stat.st_mtime_ns > recent:
+                    pending.append(entry.name)
+                else:
+                    broken.append((entry.name,) + key)
+        removed = [name for name in known if name not in present]
+
+        with self.lock, self.db:
+            self._upsert(changed)
+            self.db.executemany('DELETE FROM drawings WHERE filename = ?',
+                                [(name,) for name in removed])
+            self.db.executemany('INSERT OR REPLACE INTO unreadable VALUES (?, ?, ?)',
+                                broken)
+            self.db.executemany('DELETE FROM unreadable WHERE filename = ?',
+                                [(row[0],) for row in changed]
+                                + [(name,) for name in bad if name not in present])
+            # Only trust the folder mtime once every file has been read or
+            # found corrupt
+            if not pending:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO state VALUES ('folder_mtime_ns', ?)",
+                    (folder_mtime,))
+        return [row[0] for row in changed], removed, pending
+
+    def _rewritten(self, bad):
+        """Whether any file remembered as unreadable has changed or gone"""
+        for name, key in bad.items():
+            try:
+                stat = os.stat(os.path.join(self.folder, name))
+            except OSError:
+                return True
+            if (stat.st_size, stat.st_mtime_ns) != key:
+                return True
+        return False
+
+    def _where(self, search=None, since=None, until=None,
+               min_strokes=None, max_strokes=None):
+        clauses, params = [], []
+        if search:
+            clauses.append("filename LIKE ? ESCAPE '\\'")
+            escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            params.append(f'%{escaped}%')
+        for clause, value in (('timestamp >= ?', since), ('timestamp <= ?', until),
+                              ('strokes >= ?', min_strokes),
+                              ('strokes <= ?', max_strokes)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def query(self, offset=0, limit=None, sort='filename', descending=True,
+              **filters):
+        """Page of catalog rows as dicts, plus the total matching count
+
+        filters are search (substring of the file name), since/until
+        (timestamp bounds) and min_strokes/max_strokes.
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f'cannot sort by {sort!r}')
+        column = 'mtime_ns' if sort == 'mtime' else sort
+        where, params = self._where(**filters)
+        order = 'DESC' if descending else 'ASC'
+        with self.lock:
+            total = self.db.execute(
+                f'SELECT COUNT(*) FROM drawings{where}', params).fetchone()[0]
+            rows = self.db.execute(
+                f'SELECT * FROM drawings{where} ORDER BY {column} {order}, '
+                f'filename {order} LIMIT ? OFFSET ?',
+                params + [-1 if limit is None else limit, offset]).fetchall()
+        return [dict(row) for row in rows], total
+
+    def filenames(self, descending=True, limit=None, after=None, through=None):
+        """Cataloged file names, sorted
+
+        Paging is by key rather than offset so every page costs the same:
+        after skips names up to and including it, through stops at it.
+        """
+        order = 'DESC' if descending else 'ASC'
+        past, before = ('<', '>=') if descending else ('>', '<=')
+        clauses, params = [], []
+        if after is not None:
+            clauses.append(f'filename {past} ?')
+            params.append(after)
+        if through is not None:
+            clauses.append(f'filename {before} ?')
+            params.append(through)
+        where = (' WHERE ' + ' AND '.join(clauses)) if clauses else ''
+        with self.lock:
+            return [name for name, in self.db.execute(
+                f'SELECT filename FROM drawings{where} ORDER BY filename {order} '
+                f'LIMIT ?', params + [-1 if limit is None else limit])]
+
+    def find(self, content_hash):
+        """Name of a cataloged drawing with this content hash, or None"""
+        with self.lock:
+            row = self.db.execute(
+                'SELECT filename FROM drawings WHERE content_hash = ? LIMIT 1',
+                (content_hash,)).fetchone()
+        return row[0] if row else None
+
+    def count(self):
+        """Number of cataloged drawings"""
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM drawings').fetchone()[0]
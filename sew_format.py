@@ -0,0 +1,200 @@
+"""Binary drawing files (.sewb)
+
+The drawing page saves JSON with one number per line, which is large
+and slow to parse. A .sewb file holds the same drawing as:
+
+    header        32 bytes, see HEADER
+    metadata      JSON: timestamp and the color/mirror/type palettes
+    stroke table  STROKE_DTYPE per stroke (point count, width, palette indices)
+    coordinates   float32 x, y pairs, or quantized int16/int32 deltas,
+                  optionally zlib-compressed
+
+Each section starts on an 8-byte boundary. Raw float32 coordinates are
+mapped straight from the file with mmap, so loading one copies nothing;
+the delta encodings are smaller but decoded with one cumsum.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+
+import numpy as np
+
+MAGIC = b'SEWB'
+VERSION = 1
+EXTENSION = '.sewb'
+
+# Files the viewer, server and batch tools treat as drawings
+DRAWING_EXTENSIONS = ('.json', EXTENSION)
+
+# magic, version, flags, strokes, points, quantum, width, height, metadata bytes
+HEADER = struct.Struct('<4sHHIIfffI')
+
+# Header flags
+FLAG_DELTA = 1      # coordinates are quantized deltas instead of float32
+FLAG_WIDE = 2       # deltas are int32 (otherwise int16)
+FLAG_ZLIB = 4       # coordinate section is zlib-compressed
+
+# Coordinate encodings accepted by write_drawing
+ENCODINGS = {
+    'raw': 0,
+    'delta': FLAG_DELTA,
+    'compressed': FLAG_DELTA | FLAG_ZLIB,
+}
+
+# Quantized coordinates are stored in 1/QUANTUM px steps
+QUANTUM = 16.0
+
+STROKE_DTYPE = np.dtype([
+    ('count', '<u4'),
+    ('width', '<f4'),
+    ('color', '<u2'),
+    ('mirror', 'u1'),
+    ('type', 'u1'),
+])
+
+class FormatError(ValueError):
+    """Raised for files that are not valid .sewb drawings"""
+
+def is_drawing_file(name):
+    """True for file names the drawing tools can load"""
+    return name.lower().endswith(DRAWING_EXTENSIONS)
+
+def is_binary_file(path):
+    """True if path starts with the .sewb magic"""
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def _align(size):
+    return (size + 7) & ~7
+
+def _palette(values):
+    """Unique values in first-seen order and each value's index"""
+    palette = list(dict.fromkeys(values))
+    lookup = {value: i for i, value in enumerate(palette)}
+    return palette, [lookup[value] for value in values]
+
+def encode_drawing(drawing, encoding='raw'):
+    """Serialize a Drawing (its source strokes) to .sewb bytes"""
+    flags = ENCODINGS[encoding]
+    strokes = drawing.source_strokes
+    points = np.ascontiguousarray(drawing.points, dtype='<f4')
+    offsets = drawing.offsets
+
+    colors, color_index = _palette([stroke.color for stroke in strokes])
+    mirrors, mirror_index = _palette([stroke.mirror for stroke in strokes])
+    types, type_index = _palette([stroke.type for stroke in strokes])
+    meta = json.dumps({
+        'timestamp': drawing.timestamp,
+        'colors': colors,
+        'mirrors': mirrors,
+        'types': types,
+    }, separators=(',', ':')).encode('utf-8')
+
+    table = np.zeros(len(strokes), dtype=STROKE_DTYPE)
+    table['count'] = np.diff(offsets)
+    table['width'] = [stroke.width for stroke in strokes]
+    table['color'] = color_index
+    table['mirror'] = mirror_index
+    table['type'] = type_index
+
+    if flags & FLAG_DELTA:
+        # Every point is stored relative to the one before it, across
+        # stroke boundaries, so one cumsum restores them all
+        quantized = np.rint(points.astype(np.float64) * QUANTUM).astype(np.int64)
+        deltas = np.diff(quantized, axis=0, prepend=np.zeros((1, 2), np.int64))
+        if len(deltas) and np.abs(deltas).max() > np.iinfo(np.int16).max:
+            flags |= FLAG_WIDE
+        coords = deltas.astype('<i4' if flags & FLAG_WIDE else '<i2').tobytes()
+    else:
+        coords = points.tobytes()
+    if flags & FLAG_ZLIB:
+        coords = zlib.compress(coords, 6)
+
+    header = HEADER.pack(MAGIC, VERSION, flags, len(strokes), len(points),
+                         QUANTUM, drawing.width or 0, drawing.height or 0,
+                         len(meta))
+    parts = [header, meta, table.tobytes(), coords]
+    return b''.join(part + b'\0' * (_align(len(part)) - len(part))
+                    for part in parts[:-1]) + parts[-1]
+
+def write_drawing(path, drawing, encoding='raw'):
+    """Write drawing to path as .sewb, replacing any existing file atomically
+
+    Returns the number of bytes written.
+    """
+    data = encode_drawing(drawing, encoding)
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(
+        prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=folder)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return len(data)
+
+def read_drawing(path):
+    """Map a .sewb file and return its parts
+
+    Returns (content_hash, width, height, timestamp, points, offsets,
+    pens) ready for sew_model.Drawing, where pens lists each stroke's
+    (color, width, mirror, type). With raw coordinates, points is a
+    read-only view of the mapped file.
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < HEADER.size:
+            raise FormatError(f'{path}: too short for a .sewb header')
+        # The mapping stays open for as long as the arrays use it
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    (magic, version, flags, stroke_count, point_count, quantum,
+     width, height, meta_size) = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise FormatError(f'{path}: not a .sewb file')
+    if version > VERSION:
+        raise FormatError(f'{path}: .sewb version {version} is newer than '
+                          f'this reader (version {VERSION})')
+
+    content_hash = hashlib.sha1(buffer).hexdigest()
+    offset = _align(HEADER.size)
+    meta = json.loads(bytes(buffer[offset:offset + meta_size]))
+    offset = _align(offset + meta_size)
+    table = np.frombuffer(buffer, dtype=STROKE_DTYPE, count=stroke_count,
+                          offset=offset)
+    offset = _align(offset + table.nbytes)
+
+    if flags & FLAG_ZLIB:
+        coords = zlib.decompress(buffer[offset:])
+        offset = 0
+    else:
+        coords = buffer
+    if flags & FLAG_DELTA:
+        dtype = '<i4' if flags & FLAG_WIDE else '<i2'
+        deltas = np.frombuffer(coords, dtype=dtype, count=2 * point_count,
+                               offset=offset).reshape(-1, 2)
+        points = (np.cumsum(deltas, axis=0, dtype=np.int64)
+                  / quantum).astype(np.float32)
+    else:
+        points = np.frombuffer(coords, dtype='<f4', count=2 * point_count,
+                               offset=offset).reshape(-1, 2)
+
+    offsets = np.zeros(stroke_count + 1, dtype=np.int64)
+    np.cumsum(table['count'], out=offsets[1:])
+    if offsets[-1] != point_count:
+        raise FormatError(f'{path}: stroke table does not match point count')
+
+    colors, mirrors, types = meta['colors'], meta['mirrors'], meta['types']
+    pens = [(colors[c], int(w) if w.is_integer() else w, mirrors[m], types[t])
+            for c, w, m, t in zip(table['color'].tolist(), table['width'].tolist(),
+                                  table['mirror'].tolist(), table['type'].tolist())]
+    return (content_hash, width or None, height or None,
+            meta.get('timestamp', 'Unknown'), points, offsets, pens)
@@ -0,0 +1,410 @@
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+
+import numpy as np
+import pystitch
+
+from sew_format import is_binary_file, read_drawing
+from sew_plan import plan_strokes
+from sew_symmetry import expand_strokes
+
+# Scaling factor (divide by 4 for reasonable embroidery size)
+# 1 unit in pystitch = 0.1mm
+DEFAULT_SCALE = 0.25
+
+# Settings passed to pystitch.write_pes
+PES_SETTINGS = {
+    'max_stitch': 120,
+    'tie_on': True,
+    'tie_off': True
+}
+
+# Planning passes applied by build_pattern (see sew_plan.plan_strokes)
+BUILD_SETTINGS = {
+    'group_colors': True,
+    'merge_strokes': True,
+    'optimize_order': True,
+    'resample': True,
+}
+
+class ExportCancelled(Exception):
+    """Raised when an export is cancelled before it completes"""
+
+class EmptyPattern(ValueError):
+    """Raised when a drawing has no stroke that makes stitches"""
+
+class Stroke:
+    """One stroke: its pen settings and an (n, 2) coordinate array
+
+    For strokes owned by a Drawing the coordinates are a float32 view
+    into the drawing's single point array, so a stroke costs a few
+    dozen bytes however many points it has.
+    """
+    __slots__ = ('coordinates', 'color', 'width', 'mirror', 'type',
+                 'mirror_of', 'stitch')
+
+    def __init__(self, coordinates, color='#000000', width=1, mirror='none',
+                 type='line', mirror_of=None, stitch=None):
+        self.coordinates = coordinates
+        self.color = color
+        self.width = width
+        self.mirror = mirror
+        self.type = type
+        self.mirror_of = mirror_of      # index of the source stroke for copies
+        self.stitch = stitch            # stitch type once planned
+
+    def replace(self, **changes):
+        """Copy of this stroke with some attributes changed"""
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return Stroke(**values)
+
+def pack_coordinates(arrays):
+    """Concatenate coordinate arrays into one float32 array
+
+    Returns (points, offsets, views) where stroke i is
+    points[offsets[i]:offsets[i + 1]] and views holds those slices.
+    """
+    counts = [len(a) for a in arrays]
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    points = np.empty((offsets[-1], 2), dtype=np.float32)
+    for a, start, end in zip(arrays, offsets[:-1], offsets[1:]):
+        points[start:end] = a
+    views = [points[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+    return points, offsets, views
+
+def stroke_pen(stroke):
+    """(color, width, mirror, type) of a stroke dict from the drawing page"""
+    return (stroke.get('color', '#000000'), stroke.get('width', 1),
+            stroke.get('mirror', 'none'), stroke.get('type', 'line'))
+
+def _packed_bounds(points, offsets):
+    """Per-stroke x1, y1, x2, y2 of packed coordinates, NaN if empty"""
+    bounds = np.full((len(offsets) - 1, 4), np.nan)
+    filled = np.diff(offsets) > 0
+    if filled.any():
+        starts = offsets[:-1][filled]
+        bounds[filled, :2] = np.minimum.reduceat(points, starts, axis=0)
+        bounds[filled, 2:] = np.maximum.reduceat(points, starts, axis=0)
+    return bounds
+
+class Drawing:
+    """A parsed drawing file shared by the preview and every exporter
+
+    Every stroke's points live in one contiguous float32 array (points)
+    with per-stroke offsets; the parsed JSON is not kept. Mirror copies
+    are expanded on first use and packed the same way.
+    """
+    __slots__ = ('path', 'content_hash', 'width', 'height', 'timestamp',
+                 'points', 'offsets', 'source_strokes', '_expanded',
+                 '_copy_points', '_copy_offsets')
+
+    def __init__(self, path, content_hash, width, height, timestamp,
+                 points, offsets, pens):
+        self.path = path
+        self.content_hash = content_hash
+        self.width = width
+        self.height = height
+        self.timestamp = timestamp
+        self.points = points
+        self.offsets = offsets
+        # Strokes exactly as saved by the drawing page; pens holds each
+        # stroke's (color, width, mirror, type)
+        self.source_strokes = [
+            Stroke(points[start:end], sys.intern(color), width,
+                   sys.intern(mirror), sys.intern(kind))
+            for (color, width, mirror, kind), start, end
+            in zip(pens, offsets[:-1].tolist(), offsets[1:].tolist())]
+        self._expanded = None
+        self._copy_points = np.empty((0, 2), dtype=np.float32)
+        self._copy_offsets = np.zeros(1, dtype=np.int64)
+
+    @classmethod
+    def from_json(cls, path, data, content_hash):
+        """Build a Drawing from the dict saved by the drawing page"""
+        raw = data.get('strokes', [])
+        counts = [len(stroke.get('coordinates', ())) for stroke in raw]
+        offsets = np.zeros(len(raw) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        # Read the nested lists straight into one float32 array
+        points = np.fromiter(
+            chain.from_iterable(chain.from_iterable(
+                stroke.get('coordinates', ()) for stroke in raw)),
+            dtype=np.float32, count=2 * int(offsets[-1])).reshape(-1, 2)
+        pens = [stroke_pen(stroke) for stroke in raw]
+        return cls(path, content_hash, data.get('width'), data.get('height'),
+                   data.get('timestamp', 'Unknown'), points, offsets, pens)
+
+    @classmethod
+    def from_arrays(cls, path, header, arrays, pens, content_hash):
+        """Build a Drawing from per-stroke (N, 2) coordinate arrays and pens
+
+        header holds the other drawing fields.
+        """
+        points, offsets, _ = pack_coordinates(arrays)
+        return cls(path, content_hash, header.get('width'), header.get('height'),
+                   header.get('timestamp', 'Unknown'), points, offsets, pens)
+
+    @property
+    def filename(self):
+        return os.path.basename(self.path)
+
+    @property
+    def base_name(self):
+        return os.path.splitext(self.filename)[0]
+
+    @property
+    def strokes(self):
+        """Strokes with their mirror copies, expanded once and cached"""
+        if self._expanded is None:
+            expanded = expand_strokes(self.source_strokes, self.width, self.height)
+            copies = [stroke for stroke in expanded if stroke.mirror_of is not None]
+            if copies:
+                # The copies share one float32 array, like the source strokes
+                self._copy_points, self._copy_offsets, views = pack_coordinates(
+                    [stroke.coordinates for stroke in copies])
+                for stroke, view in zip(copies, views):
+                    stroke.coordinates = view
+            self._expanded = expanded
+        return self._expanded
+
+    def stroke_bounds(self):
+        """(n, 4) x1, y1, x2, y2 of every stroke in strokes, NaN if empty
+
+        Computed straight from the packed point arrays, one reduceat per
+        array rather than a pass per stroke.
+        """
+        strokes = self.strokes
+        is_copy = np.array([stroke.mirror_of is not None for stroke in strokes],
+                           dtype=bool)
+        bounds = np.empty((len(strokes), 4))
+        bounds[~is_copy] = _packed_bounds(self.points, self.offsets)
+        bounds[is_copy] = _packed_bounds(self._copy_points, self._copy_offsets)
+        return bounds
+
+    def summary(self):
+        """One-line description for the info label"""
+        count = len(self.source_strokes)
+        if len(self.strokes) != count:
+            return f'{count} strokes ({len(self.strokes)} with mirrors) | {self.timestamp}'
+        return f'{count} strokes | {self.timestamp}'
+
+def load_drawing_file(path):
+    """Read and parse a drawing file (JSON or .sewb) into a Drawing"""
+    if is_binary_file(path):
+        return Drawing(path, *read_drawing(path))
+    with open(path, 'rb') as f:
+        raw = f.read()
+    content_hash = hashlib.sha1(raw).hexdigest()
+    return Drawing.from_json(path, json.loads(raw), content_hash)
+
+# Built patterns and stroke plans keyed by (content hash, scale, settings)
+_pattern_cache = OrderedDict()
+_plan_cache = OrderedDict()
+_pattern_lock = threading.Lock()
+PATTERN_CACHE_SIZE = 8
+
+def _settings_key(settings):
+    return tuple(sorted((BUILD_SETTINGS if settings is None else settings).items()))
+
+def _cache_get(cache, key):
+    with _pattern_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+def _cache_put(cache, key, value):
+    with _pattern_lock:
+        cache[key] = value
+        while len(cache) > PATTERN_CACHE_SIZE:
+            cache.popitem(last=False)
+
+def plan_for(drawing, scale=DEFAULT_SCALE, settings=None, check=None):
+    """Planned stroke order for a drawing and the planning report
+
+    Runs the sew_plan passes enabled in settings (BUILD_SETTINGS by
+    default) over the expanded strokes; memoized like build_pattern.
+    check() is polled while planning and may raise to stop it.
+    Returns (strokes, report).
+    """
+    key = (drawing.content_hash, scale, _settings_key(settings))
+    plan = _cache_get(_plan_cache, key)
+    if plan is None:
+        plan = plan_strokes(drawing.strokes, scale,
+                            BUILD_SETTINGS if settings is None else settings,
+                            check)
+        _cache_put(_plan_cache, key, plan)
+    return plan
+
+def add_stroke_block(pattern, points, color, previous_color):
+    """Append one stroke, changing thread only when the color changes
+
+    pattern.add_block() ends every block with a color change, and PES
+    allows at most 255 of them, which mirrored drawings easily exceed.
+    Consecutive strokes of one color are joined with a trim and a jump
+    instead.
+    """
+    if color != previous_color:
+        if previous_color is not None:
+            pattern.add_command(pystitch.COLOR_BREAK)
+        pattern.add_thread(color)
+    else:
+        pattern.add_command(pystitch.TRIM)
+        pattern.add_stitch_absolute(pystitch.JUMP, *points[0])
+    for x, y in points:
+        pattern.add_stitch_absolute(pystitch.STITCH, x, y)
+
+def build_pattern(drawing, scale=DEFAULT_SCALE, settings=None,
+                  progress=None):
+    """Build (or reuse) the pystitch pattern for a drawing
+
+    settings holds options that change how the pattern is built
+    (BUILD_SETTINGS when None), such as the sew_plan passes run on the
+    strokes first. Writer options such as PES_SETTINGS are applied by
+    pystitch at write time, so PES and SVG exports of the same drawing
+    share one pattern.
+    Patterns are memoized per (content hash, scale, settings), so
+    exporting the same drawing again skips construction entirely.
+
+    progress, if given, is called as progress(done, total) after each
+    stroke; it may raise ExportCancelled to abandon the build.
+    """
+    key = (drawing.content_hash, scale, _settings_key(settings))
+    pattern = _cache_get(_pattern_cache, key)
+    if pattern is not None:
+        return pattern
+
+    pattern = pystitch.EmbPattern()
+    # Planning reports no progress but still gives progress a chance to
+    # cancel
+    check = (lambda: progress(0, len(drawing.strokes))) if progress else None
+    strokes, _ = plan_for(drawing, scale, settings, check)
+    previous_color = None
+
+    # Convert each stroke
+    for done, stroke in enumerate(strokes, 1):
+        coords = stroke.coordinates
+        color = stroke.color
+
+        if len(coords) >= 2:  # Skip single points
+            # Scale coordinates
+            scaled_coords = (np.asarray(coords, dtype=np.float64) * scale).tolist()
+
+            # Add to pattern
+            add_stroke_block(pattern, scaled_coords, color, previous_color)
+            previous_color = color
+
+        if progress:
+            progress(done, len(strokes))
+
+    _cache_put(_pattern_cache, key, pattern)
+    return pattern
+
+# Export formats: writer function and the settings it is called with
+WRITERS = {
+    'pes': (pystitch.write_pes, PES_SETTINGS),
+    'svg': (pystitch.write_svg, None),
+    'dst': (pystitch.write_dst, None),
+    'exp': (pystitch.write_exp, None),
+    'jef': (pystitch.write_jef, None),
+}
+
+def _write_temp(pattern, output_file, fmt):
+    """Write pattern to a hidden temp file next to output_file
+
+    Returns (temp path, seconds taken).
+    """
+    start = time.perf_counter()
+    writer, settings = WRITERS[fmt]
+    folder = os.path.dirname(os.path.abspath(output_file))
+    fd, temp_path = tempfile.mkstemp(
+        prefix='.' + os.path.basename(output_file) + '.', suffix='.tmp',
+        dir=folder)
+    # pystitch picks text or binary mode itself when given a path
+    os.close(fd)
+    try:
+        if settings is None:
+            writer(pattern, temp_path)
+        else:
+            writer(pattern, temp_path, settings)
+        # mkstemp files are owner-only; exports should be readable
+        os.chmod(temp_path, 0o644)
+    except BaseException:
+        _discard(temp_path)
+        raise
+    return temp_path, time.perf_counter() - start
+
+def _discard(temp_path):
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+def write_atomic(pattern, output_file, fmt, is_cancelled=None):
+    """Write pattern to a temp file beside output_file, then rename it
+
+    A failed or cancelled write never leaves a partial file at
+    output_file. Returns the seconds the writer took.
+    """
+    temp_path, seconds = _write_temp(pattern, output_file, fmt)
+    if is_cancelled and is_cancelled():
+        _discard(temp_path)
+        raise ExportCancelled()
+    os.replace(temp_path, output_file)
+    return seconds
+
+def export_formats(drawing, targets, scale=DEFAULT_SCALE, progress=None,
+                   is_cancelled=None, settings=None):
+    """Build the pattern once and write it to several formats
+
+    targets maps format -> output file. The formats are written one after
+    another: even for the largest drawings all of them together take
+    about a second, less than starting worker processes would save.
+    progress(done, total) is reported per stroke block plus one step per
+    finished write; is_cancelled() is polled between blocks and before
+    each file is renamed into place. settings is passed to build_pattern.
+    A drawing with nothing to stitch (only dots, say) raises EmptyPattern
+    before any file is written.
+
+    Returns seconds taken per format, plus 'build' for the pattern.
+    """
+    timings = {}
+    # Planning drops strokes that produce no stitches, so the stroke count
+    # is whatever build_pattern reports
+    blocks = len(drawing.strokes)
+
+    def on_block(done, count=None):
+        nonlocal blocks
+        if count is not None:
+            blocks = count
+        if is_cancelled and is_cancelled():
+            raise ExportCancelled()
+        if progress:
+            progress(done, blocks + len(targets))
+
+    start = time.perf_counter()
+    pattern = build_pattern(drawing, scale, settings, progress=on_block)
+    timings['build'] = time.perf_counter() - start
+    # Some writers (JEF) fail on a pattern without stitches
+    if not pattern.stitches:
+        raise EmptyPattern('nothing to stitch: the drawing has no stroke '
+                           'with two or more points')
+    on_block(blocks)
+
+    for done, (fmt, output_file) in enumerate(targets.items(), blocks + 1):
+        timings[fmt] = write_atomic(pattern, output_file, fmt, is_cancelled)
+        on_block(done)
+    return timings
+
+def export_drawing(drawing, output_file, fmt, scale=DEFAULT_SCALE,
+                   progress=None, is_cancelled=None):
+    """Build the pattern for a drawing and write it to one format"""
+    return export_formats(drawing, {fmt: output_file}, scale,
+                          progress, is_cancelled)[fmt]
@@ -0,0 +1,92 @@
+"""Convert saved JSON drawings to the binary .sewb format
+
+Usage:
+    python sew_pack.py                          # every JSON in SewCustom/
+    python sew_pack.py SewCustom/drawing_2025*.json -e compressed --remove
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+from sew_format import ENCODINGS, EXTENSION, is_binary_file, write_drawing
+from sew_model import load_drawing_file
+
+SEW_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SewCustom')
+
+def collect_json(patterns):
+    """Expand glob patterns (or the SewCustom folder) to JSON drawing paths"""
+    if not patterns:
+        patterns = [SEW_FOLDER]
+    sources = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '*.json')
+        sources.update(path for path in glob.glob(pattern)
+                       if path.lower().endswith('.json') and not is_binary_file(path))
+    return sorted(sources)
+
+def convert(source, encoding, remove):
+    """Write source as .sewb next to it; returns (json bytes, sewb bytes)"""
+    drawing = load_drawing_file(source)
+    target = os.path.splitext(source)[0] + EXTENSION
+    size = write_drawing(target, drawing, encoding)
+
+    # Check the new file reads back before touching the original
+    check = load_drawing_file(target)
+    if len(check.source_strokes) != len(drawing.source_strokes) \
+            or len(check.points) != len(drawing.points):
+        os.remove(target)
+        raise ValueError('read-back check failed')
+    json_size = os.path.getsize(source)
+    if remove:
+        os.remove(source)
+    return json_size, size
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Convert JSON drawings to the binary .sewb format')
+    parser.add_argument('inputs', nargs='*',
+                        help='JSON files, folders or glob patterns '
+                             '(default: SewCustom/)')
+    parser.add_argument('-e', '--encoding', choices=list(ENCODINGS), default='raw',
+                        help='raw float32 (memory-mapped on load), quantized '
+                             'deltas, or compressed deltas (default: raw)')
+    parser.add_argument('--remove', action='store_true',
+                        help='delete each JSON file once its .sewb is written')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    sources = collect_json(args.inputs)
+    if not sources:
+        print('No JSON drawings found')
+        return 1
+
+    print(f'📦 Converting {len(sources)} drawing(s) to {EXTENSION} ({args.encoding})')
+    total_json = total_sewb = failed = 0
+    start = time.perf_counter()
+    for source in sources:
+        name = os.path.basename(source)
+        try:
+            json_size, size = convert(source, args.encoding, args.remove)
+        except Exception as e:
+            failed += 1
+            print(f'  ❌ {name}: {e}')
+            continue
+        total_json += json_size
+        total_sewb += size
+        print(f'  ✅ {name}: {json_size:,} -> {size:,} bytes '
+              f'({json_size / max(size, 1):.1f}x smaller)')
+
+    print('=' * 60)
+    print(f'Converted {len(sources) - failed}, failed {failed} '
+          f'in {time.perf_counter() - start:.2f}s')
+    if total_sewb:
+        print(f'Total: {total_json:,} -> {total_sewb:,} bytes '
+              f'({total_json / total_sewb:.1f}x smaller)')
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,518 @@
+"""Stitch planning passes run on strokes before the pattern is built
+
+Each pass takes the expanded stroke list (see sew_symmetry) and returns
+a new list plus a small report, leaving the input untouched. Passes take
+an optional check() callable, called every CHECK_EVERY steps, which may
+raise to abandon planning (the viewer's Cancel button).
+"""
+import heapq
+import math
+import time
+
+import numpy as np
+
+from sew_stitches import resample_strokes
+
+# Rough machine model used for run-time estimates
+STITCHES_PER_MINUTE = 650
+MAX_JUMP_UNITS = 121        # longest single jump, in 0.1mm units
+TRIM_SECONDS = 4.0
+COLOR_CHANGE_SECONDS = 30.0
+
+# Strokes whose ends are closer than this are sewn as one, in mm
+MERGE_TOLERANCE_MM = 0.5
+
+# Loop iterations between check() calls
+CHECK_EVERY = 256
+
+def stroke_endpoints(strokes):
+    """(n, 2) arrays of each stroke's first and last point"""
+    starts = np.empty((len(strokes), 2))
+    ends = np.empty((len(strokes), 2))
+    for i, stroke in enumerate(strokes):
+        coords = stroke.coordinates
+        starts[i] = coords[0]
+        ends[i] = coords[-1]
+    return starts, ends
+
+def stitchable(strokes):
+    """Strokes that produce stitches (the pattern skips single points)"""
+    return [stroke for stroke in strokes if len(stroke.coordinates) >= 2]
+
+def jump_lengths(strokes):
+    """Length of every jump between consecutive strokes, in drawing px"""
+    if len(strokes) < 2:
+        return np.zeros(0)
+    starts, ends = stroke_endpoints(strokes)
+    return np.hypot(*(starts[1:] - ends[:-1]).T)
+
+def color_changes(strokes):
+    """Number of thread changes needed to sew strokes in order"""
+    colors = [stroke.color for stroke in strokes]
+    return sum(1 for a, b in zip(colors, colors[1:]) if a != b)
+
+def estimate_machine_time(strokes, scale):
+    """Estimated sewing time in seconds for strokes at the given scale
+
+    Every point is a stitch, every jump costs one machine cycle per
+    MAX_JUMP_UNITS of travel, and each jump between strokes also costs a
+    trim (or a color change when the thread differs).
+    """
+    strokes = stitchable(strokes)
+    cycle = 60.0 / STITCHES_PER_MINUTE
+    stitches = sum(len(stroke.coordinates) for stroke in strokes)
+    jumps = np.ceil(jump_lengths(strokes) * scale / MAX_JUMP_UNITS).sum()
+    changes = color_changes(strokes)
+    trims = max(0, len(strokes) - 1 - changes)
+    return float((stitches + jumps) * cycle + trims * TRIM_SECONDS
+                 + changes * COLOR_CHANGE_SECONDS)
+
+def color_runs(strokes):
+    """Split strokes into maximal runs of consecutive same-color strokes"""
+    runs = []
+    for stroke in strokes:
+        if runs and runs[-1][0].color == stroke.color:
+            runs[-1].append(stroke)
+        else:
+            runs.append([stroke])
+    return runs
+
+def reverse_stroke(stroke):
+    """Copy of a stroke sewn from its end back to its start"""
+    return stroke.replace(coordinates=stroke.coordinates[::-1])
+
+def _nearest_neighbour(starts, ends, position, deadline=None, check=None):
+    """Greedy tour: always jump to the closest free stroke end
+
+    Stroke ends are looked up through a uniform grid, searching rings of
+    cells outwards from the needle; once few strokes are left and the
+    rings get sparse, a vectorized scan of the free ends is cheaper. If
+    the deadline passes, the strokes not yet visited follow in drawn
+    order. Returns (order, flipped) where flipped[i] means stroke
+    order[i] is sewn backwards.
+    """
+    n = len(starts)
+    # Endpoint e belongs to stroke e % n; e >= n is the stroke's end
+    points = np.concatenate([starts, ends])
+    low = points.min(axis=0)
+    size = max(float((points.max(axis=0) - low).max()), 1.0) / max(1, int(math.sqrt(n)))
+    cells = {}
+    for e, cell in enumerate(map(tuple, np.floor((points - low) / size)
+                                 .astype(np.int64).tolist())):
+        cells.setdefault(cell, []).append(e)
+    coords = points.tolist()
+    free = np.ones(n, dtype=bool)
+    free_list = [True] * n
+
+    order = np.arange(n, dtype=np.intp)
+    flipped = np.zeros(n, dtype=bool)
+    x, y = float(position[0]), float(position[1])
+    for step in range(n):
+        if step % CHECK_EVERY == 0:
+            if check:
+                check()
+            if deadline is not None and time.perf_counter() > deadline:
+                # Out of time: the rest keep their drawn order
+                order[step:] = np.flatnonzero(free)
+                break
+        cx, cy = int((x - low[0]) // size), int((y - low[1]) // size)
+        best, best_dist = None, math.inf
+        ring = scanned = 0
+        while best is None or best_dist > (ring - 1) * size:
+            if scanned > n - step:
+                # Sparse by now; scan every free end at once
+                dist = np.where(np.tile(free, 2), np.hypot(points[:, 0] - x, points[:, 1] - y),
+                                np.inf)
+                best = int(np.argmin(dist))
+                break
+            for cell in _ring_cells(cx, cy, ring):
+                bucket = cells.get(cell)
+                scanned += 1
+                if bucket is None:
+                    continue
+                alive = [e for e in bucket if free_list[e % n]]
+                if not alive:
+                    del cells[cell]
+                    continue
+                if len(alive) < len(bucket):
+                    cells[cell] = alive
+                for e in alive:
+                    dist = math.hypot(coords[e][0] - x, coords[e][1] - y)
+                    if dist < best_dist:
+                        best, best_dist = e, dist
+            ring += 1
+        index = best % n
+        order[step] = index
+        flipped[step] = best >= n
+        free[index] = False
+        free_list[index] = False
+        x, y = coords[index] if best >= n else coords[index + n]
+    return order, flipped
+
+def _ring_cells(cx, cy, ring):
+    """Grid cells at Chebyshev distance ring from (cx, cy)"""
+    if ring == 0:
+        yield (cx, cy)
+        return
+    for dx in range(-ring, ring + 1):
+        yield (cx + dx, cy - ring)
+        yield (cx + dx, cy + ring)
+    for dy in range(-ring + 1, ring):
+        yield (cx - ring, cy + dy)
+        yield (cx + ring, cy + dy)
+
+def _two_opt(entry, exit_, position, deadline, check=None):
+    """Improve an oriented tour by reversing segments
+
+    entry/exit_ are (n, 2) arrays in tour order; reversing a segment
+    reverses the strokes in it and swaps their entry and exit. Returns
+    the permutation of tour positions and which positions were flipped.
+    """
+    n = len(entry)
+    perm = np.arange(n)
+    flipped = np.zeros(n, dtype=bool)
+    entry = entry.copy()
+    exit_ = exit_.copy()
+
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(n):
+            if check and i % CHECK_EVERY == 0:
+                check()
+            before = position if i == 0 else exit_[i - 1]
+            ks = np.arange(i, n)
+            # Cost of the two edges around segment i..k, now and reversed
+            old = np.hypot(*(entry[i] - before)) + np.append(
+                np.hypot(*(entry[ks[:-1] + 1] - exit_[ks[:-1]]).T), 0.0)
+            new = np.hypot(*(exit_[ks] - before).T) + np.append(
+                np.hypot(*(entry[ks[:-1] + 1] - entry[i]).T), 0.0)
+            gain = old - new
+            best = int(np.argmax(gain))
+            if gain[best] > 1e-9:
+                k = ks[best]
+                segment = slice(i, k + 1)
+                entry[segment], exit_[segment] = (exit_[segment][::-1].copy(),
+                                                  entry[segment][::-1].copy())
+                perm[segment] = perm[segment][::-1]
+                flipped[segment] = ~flipped[segment][::-1]
+                improved = True
+            if time.perf_counter() >= deadline:
+                break
+    return perm, flipped
+
+def optimize_run(strokes, position=None, deadline=None, check=None):
+    """Reorder and reverse strokes of one run to shorten jump travel
+
+    A nearest-neighbour tour is refined by 2-opt over the stroke
+    endpoint arrays until no segment reversal helps or the deadline
+    (a time.perf_counter() value) passes; the deadline bounds the tour
+    too. position is where the needle starts; by default the run's
+    original first stroke.
+    """
+    if len(strokes) < 2:
+        return list(strokes)
+    starts, ends = stroke_endpoints(strokes)
+    if position is None:
+        position = starts[0]
+    if deadline is None:
+        deadline = time.perf_counter() + 0.5
+
+    order, flipped = _nearest_neighbour(starts, ends, position, deadline, check)
+    entry = np.where(flipped[:, None], ends[order], starts[order])
+    exit_ = np.where(flipped[:, None], starts[order], ends[order])
+
+    perm, perm_flipped = _two_opt(entry, exit_, position, deadline, check)
+    order = order[perm]
+    flipped = flipped[perm] ^ perm_flipped
+
+    return [reverse_stroke(strokes[i]) if flip else strokes[i]
+            for i, flip in zip(order, flipped)]
+
+def optimize_order(strokes, time_budget=0.5, check=None):
+    """Minimize jump travel without adding thread changes
+
+    Strokes are only reordered within runs of one color, so the color
+    sequence (and how colors layer over each other) is unchanged. Each
+    run starts from where the previous one ended, and gets a share of
+    time_budget proportional to its size.
+    """
+    strokes = stitchable(strokes)
+    runs = color_runs(strokes)
+    remaining = len(strokes)
+    end = time.perf_counter() + time_budget
+
+    ordered = []
+    position = None
+    for run in runs:
+        now = time.perf_counter()
+        deadline = now + max(0.0, end - now) * len(run) / remaining
+        remaining -= len(run)
+        run = optimize_run(run, position, deadline, check)
+        ordered.extend(run)
+        position = np.asarray(run[-1].coordinates[-1], dtype=np.float64)
+    return ordered
+
+def stroke_bboxes(strokes):
+    """(n, 4) array of x1, y1, x2, y2, padded by half the stroke width"""
+    bboxes = np.empty((len(strokes), 4))
+    for i, stroke in enumerate(strokes):
+        coords = np.asarray(stroke.coordinates, dtype=np.float64).reshape(-1, 2)
+        pad = stroke.width / 2
+        bboxes[i, :2] = coords.min(axis=0) - pad
+        bboxes[i, 2:] = coords.max(axis=0) + pad
+    return bboxes
+
+def overlap_graph(strokes):
+    """Which strokes must stay after which when regrouping colors
+
+    Stroke j depends on an earlier stroke i when their bounding boxes
+    overlap and their colors differ, since j may be sewn over i. Strokes
+    of one color can swap freely. Returns (successors, indegree):
+    successors[i] is an array of the strokes that depend on i.
+    """
+    n = len(strokes)
+    bboxes = stroke_bboxes(strokes)
+    _, codes = np.unique([stroke.color for stroke in strokes],
+                         return_inverse=True)
+
+    # Sweep along x: each stroke is tested only against the strokes whose
+    # left edge falls within its own x range
+    by_x = np.argsort(bboxes[:, 0], kind='stable')
+    x1, y1, x2, y2 = bboxes[by_x].T
+    codes = codes[by_x]
+    stops = np.searchsorted(x1, x2, side='right')
+
+    sources, targets = [], []
+    for p in range(n):
+        q = np.arange(p + 1, stops[p])
+        q = q[(y1[q] <= y2[p]) & (y1[p] <= y2[q]) & (codes[q] != codes[p])]
+        if len(q):
+            a = by_x[p]
+            b = by_x[q]
+            sources.append(np.minimum(a, b))
+            targets.append(np.maximum(a, b))
+    if sources:
+        sources = np.concatenate(sources)
+        targets = np.concatenate(targets)
+        order = np.argsort(sources, kind='stable')
+        sources, targets = sources[order], targets[order]
+    else:
+        sources = targets = np.zeros(0, dtype=np.intp)
+
+    successors = np.split(targets, np.cumsum(np.bincount(sources, minlength=n))[:-1])
+    indegree = np.bincount(targets, minlength=n)
+    return successors, indegree
+
+def group_colors(strokes, check=None):
+    """Reorder strokes so each thread color is sewn in as few runs as possible
+
+    A topological sort of overlap_graph() that keeps sewing the current
+    color while any stroke of it is free, and otherwise switches to the
+    color with the most free strokes. Strokes of one color keep their
+    drawing order among themselves.
+    """
+    strokes = stitchable(strokes)
+    if len(strokes) < 2:
+        return strokes
+    successors, indegree = overlap_graph(strokes)
+    indegree = indegree.tolist()
+
+    ready = {}
+    for i, stroke in enumerate(strokes):
+        if not indegree[i]:
+            ready.setdefault(stroke.color, []).append(i)
+
+    ordered = []
+    color = strokes[0].color
+    while len(ordered) < len(strokes):
+        if check and len(ordered) % CHECK_EVERY == 0:
+            check()
+        if not ready.get(color):
+            color = max((c for c in ready if ready[c]),
+                        key=lambda c: (len(ready[c]), -ready[c][0]))
+        i = heapq.heappop(ready[color])
+        ordered.append(strokes[i])
+        for j in successors[i].tolist():
+            indegree[j] -= 1
+            if not indegree[j]:
+                heapq.heappush(ready.setdefault(strokes[j].color, []), j)
+    return ordered
+
+def _join(chain):
+    """One stroke sewn through every (stroke, reversed) in chain"""
+    parts = []
+    for stroke, flip in chain:
+        coords = np.asarray(stroke.coordinates, dtype=np.float64).reshape(-1, 2)
+        coords = coords[::-1] if flip else coords
+        # Touching ends would stitch the same spot twice
+        if parts and np.array_equal(parts[-1][-1], coords[0]):
+            coords = coords[1:]
+        parts.append(coords)
+    return chain[0][0].replace(coordinates=np.concatenate(parts))
+
+def _merge_group(strokes, tolerance, check=None):
+    """Chain strokes end to end through a spatial hash of their endpoints"""
+    starts, ends = stroke_endpoints(strokes)
+    # Endpoint e is stroke e // 2; even e is its start, odd its end
+    points = np.empty((2 * len(strokes), 2))
+    points[0::2] = starts
+    points[1::2] = ends
+    keys = np.floor(points / tolerance).astype(np.int64).tolist()
+    cells = {}
+    for e, (cx, cy) in enumerate(keys):
+        cells.setdefault((cx, cy), []).append(e)
+    coords = points.tolist()
+    used = [False] * len(strokes)
+
+    def closest_free(e):
+        """Nearest endpoint of an unused stroke within tolerance of e"""
+        (cx, cy), (x, y) = keys[e], coords[e]
+        best, best_dist = None, tolerance
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                cell = (cx + dx, cy + dy)
+                bucket = cells.get(cell)
+                if bucket is None:
+                    continue
+                # Forget endpoints of strokes already chained
+                alive = [other for other in bucket if not used[other // 2]]
+                if len(alive) < len(bucket):
+                    cells[cell] = alive
+                for other in alive:
+                    dist = math.hypot(coords[other][0] - x, coords[other][1] - y)
+                    if dist <= best_dist:
+                        best, best_dist = other, dist
+        return best
+
+    merged = []
+    steps = 0
+    for first in range(len(strokes)):
+        if used[first]:
+            continue
+        used[first] = True
+        chain = [(first, False)]
+        # Grow from the tail, then turn the chain round and grow the head
+        for _ in range(2):
+            while True:
+                steps += 1
+                if check and steps % CHECK_EVERY == 0:
+                    check()
+                index, flip = chain[-1]
+                # The chain leaves through the stroke's start if reversed
+                e = closest_free(2 * index + (0 if flip else 1))
+                if e is None:
+                    break
+                used[e // 2] = True
+                # Entering through the stroke's end means sewing it backwards
+                chain.append((e // 2, bool(e % 2)))
+            chain = [(index, not flip) for index, flip in reversed(chain)]
+        merged.append(_join([(strokes[index], flip) for index, flip in chain])
+                      if len(chain) > 1 else strokes[first])
+    return merged
+
+def merge_strokes(strokes, tolerance, check=None):
+    """Join same-color, same-width strokes whose ends nearly touch
+
+    Lifting the pen and touching down again in the same spot leaves
+    separate strokes, each costing a trim, a jump and a tie-off/tie-on
+    pair. Within each run of one color, strokes whose endpoints are
+    within tolerance (px) of each other are chained into one stroke,
+    reversing strokes where needed. Chains are found through a spatial
+    hash with cells of tolerance size.
+    """
+    strokes = stitchable(strokes)
+    if tolerance <= 0:
+        return strokes
+    merged = []
+    for run in color_runs(strokes):
+        by_width = {}
+        for stroke in run:
+            by_width.setdefault(stroke.width, []).append(stroke)
+        for group in by_width.values():
+            merged.extend(_merge_group(group, tolerance, check)
+                          if len(group) > 1 else group)
+    return merged
+
+def order_report(before, after, scale):
+    """Jump travel (mm) and estimated machine time (s) before and after"""
+    before = stitchable(before)
+    # 1 unit in pystitch = 0.1mm
+    to_mm = scale / 10
+    return {
+        'jump_mm_before': float(jump_lengths(before).sum() * to_mm),
+        'jump_mm_after': float(jump_lengths(after).sum() * to_mm),
+        'time_s_before': estimate_machine_time(before, scale),
+        'time_s_after': estimate_machine_time(after, scale),
+    }
+
+def describe_report(report):
+    """Human-readable lines for a plan_strokes report"""
+    lines = []
+    colors = report.get('colors')
+    if colors:
+        lines.append(f'Color changes: {colors["changes_before"]} -> '
+                     f'{colors["changes_after"]}')
+    merge = report.get('merge')
+    if merge:
+        lines.append(f'Merged strokes: {merge["strokes_before"]} -> '
+                     f'{merge["strokes_after"]}, saving {merge["trims_saved"]} '
+                     f'trims and {merge["ties_saved"]} ties')
+    stitches = report.get('stitches')
+    if stitches:
+        lines.append(f'Stitches: {stitches["before"]} points -> '
+                     f'{stitches["after"]} stitches ({stitches["satin"]} satin, '
+                     f'{stitches["fill"]} fill strokes)')
+    order = report.get('order')
+    if order:
+        lines.append(f'Jumps: {order["jump_mm_before"]:.0f}mm -> '
+                     f'{order["jump_mm_after"]:.0f}mm, est. sew time '
+                     f'{order["time_s_before"] / 60:.1f} -> '
+                     f'{order["time_s_after"] / 60:.1f} min')
+    return lines
+
+def plan_strokes(strokes, scale, settings, check=None):
+    """Run the enabled planning passes; returns (strokes, report)
+
+    The report compares the drawn order with the final one. check() is
+    polled throughout and may raise to stop.
+    """
+    check = check or (lambda: None)
+    report = {}
+    drawn = strokes
+    if settings.get('group_colors'):
+        strokes = group_colors(strokes, check)
+        report['colors'] = {
+            'changes_before': color_changes(stitchable(drawn)),
+            'changes_after': color_changes(strokes),
+        }
+    if settings.get('merge_strokes'):
+        before = stitchable(strokes)
+        # 1 unit in pystitch = 0.1mm
+        tolerance = settings.get('merge_mm', MERGE_TOLERANCE_MM) * 10 / scale
+        check()
+        strokes = merge_strokes(before, tolerance, check)
+        saved = len(before) - len(strokes)
+        report['merge'] = {
+            'strokes_before': len(before),
+            'strokes_after': len(strokes),
+            'trims_saved': saved,
+            # Each trim is preceded by a tie-off and followed by a tie-on
+            'ties_saved': 2 * saved,
+        }
+    if settings.get('optimize_order'):
+        check()
+        strokes = optimize_order(strokes, settings.get('optimize_seconds', 0.5), check)
+    if settings.get('resample'):
+        check()
+        before = stitchable(strokes)
+        strokes = resample_strokes(before, scale, settings)
+        report['stitches'] = {
+            'before': sum(len(stroke.coordinates) for stroke in before),
+            'after': sum(len(stroke.coordinates) for stroke in strokes),
+            'satin': sum(1 for stroke in strokes if stroke.stitch == 'satin'),
+            'fill': sum(1 for stroke in strokes if stroke.stitch == 'fill'),
+        }
+    if strokes is not drawn:
+        report['order'] = order_report(drawn, strokes, scale)
+    return strokes, report
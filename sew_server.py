@@ -1,9 +1,24 @@
 from flask import Flask, request, jsonify, send_file, send_from_directory
 from flask_cors import CORS
+import argparse
+import atexit
+import functools
+import hashlib
 import json
 import os
+import signal
+import tempfile
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 
+from sew_catalog import SETTLE_SECONDS, SORT_COLUMNS, Catalog
+from sew_format import ENCODINGS, EXTENSION, encode_drawing
+from sew_model import Drawing
+from sew_store import WRITE_TIMEOUT, QueueFull, SaveQueue, install, wait_saved
+from sew_upload import UploadError, UploadStore, read_lines
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
@@ -11,6 +26,26 @@ CORS(app)  # Enable CORS for all routes
 SEW_FOLDER = os.path.join(os.path.dirname(__file__), 'SewCustom')
 os.makedirs(SEW_FOLDER, exist_ok=True)
 
+# How new drawings are stored: 'json' (as sent by the page) or one of the
+# .sewb encodings in sew_format.ENCODINGS ('raw', 'delta', 'compressed')
+STORAGE_FORMAT = os.environ.get('SEW_STORAGE_FORMAT', 'json')
+if STORAGE_FORMAT != 'json' and STORAGE_FORMAT not in ENCODINGS:
+    raise SystemExit(f'Unknown SEW_STORAGE_FORMAT: {STORAGE_FORMAT}')
+
+# Index of saved drawings; picks up files added while the server was down
+catalog = Catalog(SEW_FOLDER)
+catalog.reconcile(settle=SETTLE_SECONDS)
+
+# Drawings are written and cataloged by a background writer; whatever is
+# still queued is written before the server exits
+save_queue = SaveQueue(SEW_FOLDER, on_saved=catalog.add_all)
+atexit.register(save_queue.close)
+
+# Resumable stroke-by-stroke uploads and drawing sessions, kept in
+# SewCustom/.uploads
+uploads = UploadStore(SEW_FOLDER)
+uploads.expire()
+
 @app.route('/')
 def index():
     """Serve the main drawing page"""
@@ -35,68 +70,412 @@ def test():
     print(f"✅ Test request from: {request.remote_addr}")
     return f"<html><body><h1>Server is working!</h1><p>Request from: {request.remote_addr}</p></body></html>"
 
+# sha1 of recent request bodies -> content hash of the drawing each saved,
+# so a retried upload is recognised before its JSON is parsed
+RECENT_UPLOADS = 256
+recent_uploads = OrderedDict()
+recent_lock = threading.Lock()
+
+def find_saved(content_hash):
+    """Name of a saved drawing with this content hash, or None
+    
+    A matching save still in the queue is waited for; if it fails, so
+    does this.
+    """
+    queued = save_queue.queued_save(content_hash)
+    if queued is not None:
+        return wait_saved(queued)
+    filename = catalog.find(content_hash)
+    # The catalog may not have seen the file being deleted yet
+    if filename is not None and not os.path.exists(os.path.join(SEW_FOLDER, filename)):
+        filename = None
+    return filename
+
+def saved_response(filename, content_hash, duplicate, **extra):
+    if duplicate:
+        print(f"Drawing already saved as {filename}")
+    return jsonify({
+        'success': True,
+        'filename': filename,
+        'path': os.path.join(SEW_FOLDER, filename),
+        'id': content_hash,
+        'duplicate': duplicate,
+        **extra
+    })
+
+def drawing_filename(content_hash, extension):
+    """Generate filename with timestamp and content hash"""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return f'drawing_{timestamp}_{content_hash[:12]}{extension}'
+
+def store_drawing(raw, content_hash, extension, make_drawing):
+    """Save encoded drawing bytes unless the same drawing is already saved
+    
+    make_drawing() builds the Drawing for the catalog; it is only called
+    for new drawings. Returns once the file is on disk, with its name and
+    whether it was a duplicate; raises if it could not be written.
+    """
+    filename = find_saved(content_hash)
+    if filename is not None:
+        return filename, True
+        
+    filename = drawing_filename(content_hash, extension)
+    drawing = make_drawing()
+    drawing.path = os.path.join(SEW_FOLDER, filename)
+    drawing.content_hash = content_hash
+    
+    # The writer thread puts it on disk and in the catalog, sharing the
+    # fsyncs with other saves; an identical save already in the queue wins
+    future, duplicate = save_queue.put(filename, raw, drawing, key=content_hash)
+    return wait_saved(future), duplicate
+
+def error_response(error, status):
+    print(f"Error saving drawing: {error}")
+    headers = {'Retry-After': '1'} if status == 503 else {}
+    return jsonify({
+        'success': False,
+        'error': str(error)
+    }), status, headers
+
 @app.route('/save_drawing', methods=['POST'])
 def save_drawing():
-    """Receive drawing data from Kindle and save as JSON"""
+    """Receive drawing data from Kindle and save as JSON
+    
+    Files are named by time and content hash, so saves in the same second
+    never overwrite each other. A drawing identical to one already saved
+    (a retried upload, say) is not written again; the response names the
+    existing file and sets duplicate.
+    """
     try:
+        body_hash = hashlib.sha1(request.get_data()).hexdigest()
+        with recent_lock:
+            content_hash = recent_uploads.get(body_hash)
+        if content_hash is not None:
+            filename = find_saved(content_hash)
+            if filename is not None:
+                return saved_response(filename, content_hash, True)
+                
         data = request.json
         
-        # Generate filename with timestamp
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'drawing_{timestamp}.json'
-        filepath = os.path.join(SEW_FOLDER, filename)
-        
-        # Save JSON file
-        with open(filepath, 'w') as f:
-            json.dump(data, f, indent=2)
-        
-        print(f"Saved drawing to: {filepath}")
-        return jsonify({
-            'success': True,
-            'filename': filename,
-            'path': filepath
-        })
+        if STORAGE_FORMAT == 'json':
+            # Encode JSON file
+            raw = json.dumps(data, indent=2).encode('utf-8')
+            drawing = None
+            extension = '.json'
+        else:
+            # Encode binary file
+            drawing = Drawing.from_json(None, data, None)
+            raw = encode_drawing(drawing, STORAGE_FORMAT)
+            extension = EXTENSION
+        content_hash = hashlib.sha1(raw).hexdigest()
+        with recent_lock:
+            recent_uploads[body_hash] = content_hash
+            while len(recent_uploads) > RECENT_UPLOADS:
+                recent_uploads.popitem(last=False)
+                
+        filename, duplicate = store_drawing(
+            raw, content_hash, extension,
+            lambda: drawing or Drawing.from_json(None, data, None))
+        return saved_response(filename, content_hash, duplicate)
     
+    except QueueFull as e:
+        return error_response(e, 503)
     except Exception as e:
-        print(f"Error saving drawing: {e}")
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+        return error_response(e, 500)
+
+def upload_response(upload, **extra):
+    return jsonify({
+        'success': True,
+        'upload': upload.id,
+        'received': upload.received,
+        **extra
+    })
+
+def upload_route(view):
+    """Turn upload errors into JSON responses with their status codes"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            return view(*args, **kwargs)
+        except UploadError as e:
+            return error_response(e, e.status)
+        except QueueFull as e:
+            return error_response(e, 503)
+        except Exception as e:
+            return error_response(e, 500)
+    return wrapper
+
+@app.route('/uploads', methods=['POST'])
+@upload_route
+def start_upload():
+    """Start a resumable upload
+    
+    The body holds the drawing's fields without its strokes, e.g.
+    {"width": 600, "height": 800, "strokes": [], "timestamp": "..."};
+    an empty strokes list marks where the strokes go in the saved file.
+    """
+    upload = uploads.create(request.get_json(force=True))
+    return upload_response(upload)
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+@upload_route
+def upload_status(upload_id):
+    """How many strokes of an upload are safely stored"""
+    return upload_response(uploads.get(upload_id))
+
+@app.route('/uploads/<upload_id>/strokes', methods=['POST'])
+@upload_route
+def upload_strokes(upload_id):
+    """Append strokes to an upload
+    
+    The body is NDJSON (one stroke object per line, may be sent chunked)
+    with ?from=N giving the index of its first stroke, or JSON
+    {"from": N, "strokes": [...]} from a page. Strokes the server already
+    has are skipped. The response's received count is what a client
+    should send from next.
+    """
+    upload = uploads.get(upload_id)
+    if request.mimetype == 'application/json':
+        body = request.get_json()
+        if not isinstance(body, dict) or not isinstance(body.get('strokes'), list):
+            raise UploadError('expected {"from": N, "strokes": [...]}')
+        lines = (json.dumps(stroke).encode('utf-8') for stroke in body['strokes'])
+        start = body.get('from')
+    else:
+        lines = read_lines(request.stream)
+        start = request.args.get('from')
+        if start is not None:
+            try:
+                start = int(start)
+            except ValueError:
+                raise UploadError(f'from must be a stroke index (0 or more), '
+                                  f'not {start!r}') from None
+    uploads.append(upload, lines, start)
+    return upload_response(upload)
+
+@app.route('/uploads/<upload_id>/finish', methods=['POST'])
+@upload_route
+def finish_upload(upload_id):
+    """Save an upload's strokes as a drawing, as /save_drawing would, and close it
+    
+    An optional JSON body updates drawing fields first, e.g.
+    {"timestamp": "..."} for a session the page kept open while drawing.
+    """
+    upload = uploads.get(upload_id)
+    if request.content_length:
+        uploads.update(upload, request.get_json(force=True))
+    with upload.lock:
+        if upload.closed:
+            raise UploadError('no such upload', 404)
+        if STORAGE_FORMAT == 'json':
+            filename, content_hash, duplicate = store_upload_json(upload)
+        else:
+            arrays, pens = uploads.read(upload)
+            drawing = Drawing.from_arrays(None, upload.header, arrays, pens, None)
+            raw = encode_drawing(drawing, STORAGE_FORMAT)
+            content_hash = hashlib.sha1(raw).hexdigest()
+            filename, duplicate = store_drawing(raw, content_hash, EXTENSION,
+                                                lambda: drawing)
+        uploads.discard(upload)
+    return saved_response(filename, content_hash, duplicate,
+                          upload=upload.id, received=upload.received)
+
+def store_upload_json(upload):
+    """Stream an upload into a JSON drawing file without loading it whole
+    
+    Returns the file name, content hash and whether it was a duplicate.
+    """
+    fd, temp_path = tempfile.mkstemp(prefix='.upload.', suffix='.tmp', dir=SEW_FOLDER)
+    try:
+        digest = hashlib.sha1()
+        with os.fdopen(fd, 'wb') as f:
+            def write(data):
+                digest.update(data)
+                f.write(data)
+            arrays, pens = uploads.read(upload, write)
+            f.flush()
+            os.fsync(f.fileno())
+        content_hash = digest.hexdigest()
+        
+        filename = find_saved(content_hash)
+        if filename is not None:
+            os.remove(temp_path)
+            return filename, content_hash, True
+            
+        filename = drawing_filename(content_hash, '.json')
+        filepath = os.path.join(SEW_FOLDER, filename)
+        drawing = Drawing.from_arrays(filepath, upload.header, arrays, pens,
+                                      content_hash)
+        install(temp_path, filepath)
+        catalog.add(filepath, drawing)
+        print(f"Saved drawing to: {filepath}")
+        return filename, content_hash, False
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+@upload_route
+def cancel_upload(upload_id):
+    """Abandon an upload and delete what it received"""
+    upload = uploads.get(upload_id)
+    with upload.lock:
+        uploads.discard(upload)
+    return jsonify({'success': True, 'upload': upload.id})
 
 @app.route('/list_drawings', methods=['GET'])
 def list_drawings():
-    """List all saved drawings"""
+    """List saved drawings from the catalog
+    
+    Query parameters (all optional):
+      offset, limit           page through the results
+      sort, order             one of SORT_COLUMNS; 'asc' or 'desc' (default)
+      q                       substring of the file name
+      since, until            timestamp bounds (ISO strings)
+      min_strokes, max_strokes
+    """
     try:
-        files = [f for f in os.listdir(SEW_FOLDER) if f.endswith('.json')]
-        files.sort(reverse=True)  # Most recent first
+        args = request.args
+        sort = args.get('sort', 'filename')
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"sort must be one of: {', '.join(SORT_COLUMNS)}")
+        catalog.reconcile(settle=SETTLE_SECONDS)
+        drawings, total = catalog.query(
+            offset=args.get('offset', 0, type=int),
+            limit=args.get('limit', type=int),
+            sort=sort,
+            descending=args.get('order', 'desc') != 'asc',
+            search=args.get('q'),
+            since=args.get('since'),
+            until=args.get('until'),
+            min_strokes=args.get('min_strokes', type=int),
+            max_strokes=args.get('max_strokes', type=int))
         return jsonify({
             'success': True,
-            'files': files
+            'files': [drawing['filename'] for drawing in drawings],
+            'drawings': drawings,
+            'total': total
         })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+# How long a production server waits on shutdown for running requests;
+# long enough for a save that waits the full WRITE_TIMEOUT on the writer
+SHUTDOWN_TIMEOUT = WRITE_TIMEOUT + 10
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Receive drawings from the Kindle page')
+    parser.add_argument('--host', default='0.0.0.0', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--production', action='store_true',
+                        help='serve with waitress instead of the Flask '
+                             'development server')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='requests handled at once in production mode '
+                             '(default: 8)')
+    parser.add_argument('--max-body-mb', type=float, default=64,
+                        help='largest accepted request body in production '
+                             'mode (default: 64)')
+    parser.add_argument('--keep-alive', type=int, default=30,
+                        help='seconds an idle connection is kept open in '
+                             'production mode (default: 30)')
+    return parser.parse_args(argv)
+
+def serve_production(host, port, workers, max_body_mb, keep_alive):
+    """Serve the app with waitress until Ctrl+C or SIGTERM
+    
+    Requests are handled by a pool of worker threads, so uploads from
+    several devices no longer wait for each other. Bodies over the limit
+    are refused with 413 before they reach the app, and on shutdown the
+    server stops accepting connections, answers requests that are
+    already running (for up to SHUTDOWN_TIMEOUT seconds), writes out the
+    save queue and only then closes the catalog.
+    """
+    try:
+        from waitress import create_server
+        from waitress.channel import HTTPChannel
+        from waitress.server import BaseWSGIServer
+    except ImportError:
+        raise SystemExit('Production mode needs waitress: pip install waitress')
+    
+    # Our own map, so the loop can be run here whatever server type
+    # create_server picks for the address
+    channels = {}
+    server = create_server(app, map=channels, host=host, port=port, threads=workers,
+                           max_request_body_size=int(max_body_mb * 1024 * 1024),
+                           channel_timeout=keep_alive,
+                           cleanup_interval=max(1, min(30, keep_alive // 2)))
+    dispatcher = server.task_dispatcher
+    
+    # server.run() would give running requests 5 s and then stop the loop
+    # that sends their responses, so the loop is run here instead
+    stopping = []
+    def stop(signum, frame):
+        stopping.append(time.monotonic())
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    
+    def poll(timeout):
+        server.asyncore.loop(timeout=timeout, map=channels,
+                             use_poll=server.adj.asyncore_use_poll, count=1)
+    
+    def busy():
+        """Whether a request is being received, handled or answered"""
+        return dispatcher.queue or dispatcher.active_count or any(
+            channel.request is not None or channel.requests or channel.total_outbufs_len
+            for channel in list(channels.values()) if isinstance(channel, HTTPChannel))
+    
+    try:
+        while not stopping:
+            poll(server.adj.asyncore_loop_timeout)
+        for listener in list(channels.values()):
+            if isinstance(listener, BaseWSGIServer):
+                listener.accepting = False
+        deadline = stopping[0] + SHUTDOWN_TIMEOUT
+        while busy() and time.monotonic() < deadline:
+            poll(0.05)
+    finally:
+        dispatcher.shutdown()
+        # Saves still queued are written before the catalog goes away
+        save_queue.close()
+        catalog.close()
+        print("Server stopped")
+
 if __name__ == '__main__':
     import socket
+    args = parse_args()
     hostname = socket.gethostname()
     local_ip = socket.gethostbyname(hostname)
     
     print("=" * 60)
     print("🧵 Embroidery Server Started!")
     print("=" * 60)
-    print(f"Drawings will be saved to: {SEW_FOLDER}")
+    print(f"Drawings will be saved to: {SEW_FOLDER} ({STORAGE_FORMAT})")
+    if args.production:
+        print(f"Production mode: {args.workers} workers, bodies up to "
+              f"{args.max_body_mb:g} MB, keep-alive {args.keep_alive}s")
     print(f"\nAccess the drawing app from:")
-    print(f"  • This PC:      http://localhost:8000/")
-    print(f"  • Kindle:       http://{local_ip}:8000/")
-    print(f"  • Other device: http://{local_ip}:8000/")
+    print(f"  • This PC:      http://localhost:{args.port}/")
+    print(f"  • Kindle:       http://{local_ip}:{args.port}/")
+    print(f"  • Other device: http://{local_ip}:{args.port}/")
     print(f"\nTest connection first:")
-    print(f"  • From Kindle, try: http://{local_ip}:8000/test")
+    print(f"  • From Kindle, try: http://{local_ip}:{args.port}/test")
     print("\nPress Ctrl+C to stop the server")
     print("=" * 60)
     print("\nWatching for connections...")
     
-    app.run(host='0.0.0.0', port=8000, debug=True, use_reloader=False)
+    if args.production:
+        serve_production(args.host, args.port, args.workers,
+                         args.max_body_mb, args.keep_alive)
+    else:
+        app.run(host=args.host, port=args.port, debug=True, use_reloader=False)
+        save_queue.close()
@@ -0,0 +1,225 @@
+"""Turn stroke paths into machine stitches
+
+Touch input arrives as points roughly 2px apart, far denser than a
+machine can sew. resample_strokes() respaces every stroke along its arc
+length to an even stitch length, keeping sharp corners where they are.
+All thin strokes are processed together as one concatenated array;
+strokes wide enough to cover area become satin columns or tatami fill
+built from offset curves of their centerline.
+"""
+import numpy as np
+
+# Running stitch lengths, in mm
+STITCH_MIN_MM = 1.0
+STITCH_TARGET_MM = 2.5
+STITCH_MAX_MM = 12.0        # PES_SETTINGS['max_stitch'] is 120 units
+
+# Turns sharper than this keep a stitch exactly on the corner
+CORNER_DEGREES = 60.0
+
+# Stroke widths (mm) from which satin columns and tatami fill take over
+SATIN_MIN_MM = 1.0
+FILL_MIN_MM = 6.0
+
+# Satin: distance between zigzag stitches along the column, in mm
+SATIN_SPACING_MM = 0.4
+
+# Tatami: distance between rows and length of each stitch, in mm
+FILL_ROW_MM = 0.4
+FILL_STITCH_MM = 3.0
+
+def _concatenate(strokes):
+    """All stroke points as one (n, 2) array plus each point's stroke index"""
+    arrays = [np.asarray(stroke.coordinates, dtype=np.float64).reshape(-1, 2)
+              for stroke in strokes]
+    counts = np.array([len(a) for a in arrays], dtype=np.intp)
+    points = np.concatenate(arrays) if arrays else np.zeros((0, 2))
+    return points, np.repeat(np.arange(len(strokes)), counts)
+
+def resample(points, owner, target, min_length, max_length, corner_degrees):
+    """Respace stitches along each polyline in a concatenated point array
+
+    owner gives the polyline index of each point. Every polyline is cut
+    at its ends and at corners turning more than corner_degrees, and each
+    piece is divided into equal stitches as close to target as
+    min_length..max_length allows. Returns (points, owner) for the new
+    stitches.
+    """
+    if not len(points):
+        return points, owner
+    # Drop repeated points; they would make zero-length segments
+    first = np.r_[True, owner[1:] != owner[:-1]]
+    keep = first | np.r_[True, np.any(points[1:] != points[:-1], axis=1)]
+    points, owner = points[keep], owner[keep]
+    first = first[keep]
+    last = np.r_[owner[1:] != owner[:-1], True]
+
+    # Arc length, with a unit gap between polylines so it stays increasing
+    step = np.hypot(*np.diff(points, axis=0).T)
+    step[first[1:]] = 1.0
+    arc = np.r_[0.0, np.cumsum(step)]
+
+    # Corners: interior points where the path turns sharply
+    delta = np.diff(points, axis=0)
+    heading = np.arctan2(delta[:, 1], delta[:, 0])
+    turn = np.abs((heading[1:] - heading[:-1] + np.pi) % (2 * np.pi) - np.pi)
+    corner = np.zeros(len(points), dtype=bool)
+    corner[1:-1] = (turn > np.radians(corner_degrees)) & ~first[1:-1] & ~last[1:-1]
+    # Jitter in touch input turns sharply too; ignore corners less than
+    # a stitch from the neighbouring anchors
+    anchor = first | last | corner
+    index = np.flatnonzero(anchor)
+    gap = np.diff(arc[index]) < min_length
+    crowded = np.r_[False, gap] | np.r_[gap, False]
+    anchor[index[crowded & corner[index]]] = False
+
+    # Pieces run between consecutive anchors of the same polyline
+    index = np.flatnonzero(anchor)
+    starts, ends = index[:-1], index[1:]
+    same = owner[starts] == owner[ends]
+    starts, ends = starts[same], ends[same]
+    length = arc[ends] - arc[starts]
+    # Never exceed max_length, even if that means going under min_length
+    count = np.minimum(np.rint(length / target), np.floor(length / min_length))
+    count = np.maximum.reduce([count, np.ceil(length / max_length),
+                               np.ones_like(count)]).astype(np.intp)
+
+    # Every piece emits its start and interior stitches; the last piece
+    # of a polyline also emits the polyline's end point
+    closing = last[ends]
+    emitted = count + closing
+    piece = np.repeat(np.arange(len(starts)), emitted)
+    k = np.arange(len(piece)) - np.repeat(np.cumsum(emitted) - emitted, emitted)
+    s = arc[starts][piece] + length[piece] * (k / count[piece])
+    stitches = np.column_stack((np.interp(s, arc, points[:, 0]),
+                                np.interp(s, arc, points[:, 1])))
+    return stitches, owner[starts][piece]
+
+def _centerline(coords, spacing):
+    """Points every spacing px along a polyline
+
+    Returns (points, arc length of each point, total length), or None
+    for a polyline with no length.
+    """
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    step = np.hypot(*np.diff(coords, axis=0).T)
+    arc = np.r_[0.0, np.cumsum(step)]
+    length = arc[-1]
+    if length <= 0:
+        return None
+    # Repeated points would give np.interp a flat arc
+    keep = np.r_[True, step > 0]
+    coords, arc = coords[keep], arc[keep]
+    s = np.linspace(0.0, length, max(2, int(np.ceil(length / spacing)) + 1))
+    points = np.column_stack((np.interp(s, arc, coords[:, 0]),
+                              np.interp(s, arc, coords[:, 1])))
+    return points, s, length
+
+def _normals(points, window):
+    """Unit normals of a sampled polyline
+
+    Tangents are averaged over window samples so touch jitter does not
+    twist the offset curves.
+    """
+    tangent = np.gradient(points, axis=0)
+    if window > 1 and len(points) > window:
+        kernel = np.ones(window) / window
+        padded = np.pad(tangent, ((window // 2, window - 1 - window // 2), (0, 0)),
+                        mode='edge')
+        tangent = np.column_stack([np.convolve(padded[:, i], kernel, mode='valid')
+                                   for i in range(2)])
+    norm = np.hypot(tangent[:, 0], tangent[:, 1])
+    norm[norm == 0] = 1.0
+    return np.column_stack((-tangent[:, 1], tangent[:, 0])) / norm[:, None]
+
+def satin_column(coords, width, spacing):
+    """Zigzag stitches alternating between the two offset curves of a stroke"""
+    line = _centerline(coords, spacing)
+    if line is None:
+        return None
+    points, _, _ = line
+    normals = _normals(points, max(1, int(width / spacing)))
+    side = np.where(np.arange(len(points)) % 2, -0.5, 0.5) * width
+    return points + normals * side[:, None]
+
+def tatami_fill(coords, width, row_spacing, stitch_length):
+    """Rows of running stitches along offset curves, sewn back and forth
+
+    Rows follow the stroke at evenly spaced offsets across its width,
+    with stitch positions shifted by a third of a stitch from row to row
+    so the needle holes form the brick pattern of tatami fill. An odd
+    number of rows ends the fill at the far end of the stroke, where the
+    stitch planner expects it to finish.
+    """
+    line = _centerline(coords, min(row_spacing * 2, stitch_length / 4))
+    if line is None:
+        return None
+    points, s, length = line
+    normals = _normals(points, max(1, int(width / (s[1] - s[0]) / 2)))
+
+    rows = int(np.ceil(width / row_spacing)) | 1
+    offsets = np.linspace(-(width - row_spacing) / 2, (width - row_spacing) / 2, rows)
+
+    stitches = [None] * rows
+    for phase in range(3):
+        # Rows sharing a phase share stitch positions along the centerline
+        shift = phase * stitch_length / 3
+        u = np.r_[0.0, np.arange(shift or stitch_length, length, stitch_length), length]
+        at = np.column_stack([np.interp(u, s, a) for a in (*points.T, *normals.T)])
+        for row in range(phase, rows, 3):
+            # Each row is an offset curve of the centerline
+            row_points = at[:, :2] + offsets[row] * at[:, 2:]
+            stitches[row] = row_points[::-1] if row % 2 else row_points
+    return np.concatenate(stitches)
+
+def resample_strokes(strokes, scale, settings=None):
+    """Copy of strokes with their coordinates replaced by stitches
+
+    Strokes narrower than SATIN_MIN_MM get a running stitch, wider ones
+    a satin column, and from FILL_MIN_MM up a tatami fill; the kind is
+    recorded in each stroke's stitch attribute. Lengths in settings ('stitch_mm',
+    'min_stitch_mm', 'max_stitch_mm', 'satin_min_mm', 'fill_min_mm',
+    'satin_spacing_mm', 'fill_row_mm', 'fill_stitch_mm') default to the
+    module constants and are converted to drawing px with scale;
+    'corner_degrees' defaults to CORNER_DEGREES. Strokes with no length
+    are left as drawn.
+    """
+    settings = settings or {}
+    # 1 unit in pystitch = 0.1mm
+    px = 10 / scale
+    satin_min = settings.get('satin_min_mm', SATIN_MIN_MM) * px
+    fill_min = settings.get('fill_min_mm', FILL_MIN_MM) * px
+
+    resampled = list(strokes)
+    running = [i for i, stroke in enumerate(strokes)
+               if stroke.width < satin_min]
+    for i, stroke in enumerate(strokes):
+        width = stroke.width
+        if width < satin_min:
+            continue
+        if width < fill_min:
+            kind = 'satin'
+            coords = satin_column(stroke.coordinates, width,
+                                  settings.get('satin_spacing_mm', SATIN_SPACING_MM) * px)
+        else:
+            kind = 'fill'
+            coords = tatami_fill(stroke.coordinates, width,
+                                 settings.get('fill_row_mm', FILL_ROW_MM) * px,
+                                 settings.get('fill_stitch_mm', FILL_STITCH_MM) * px)
+        if coords is not None:
+            resampled[i] = stroke.replace(coordinates=coords, stitch=kind)
+
+    points, owner = _concatenate([strokes[i] for i in running])
+    stitches, stitch_owner = resample(
+        points, owner,
+        settings.get('stitch_mm', STITCH_TARGET_MM) * px,
+        settings.get('min_stitch_mm', STITCH_MIN_MM) * px,
+        settings.get('max_stitch_mm', STITCH_MAX_MM) * px,
+        settings.get('corner_degrees', CORNER_DEGREES))
+
+    counts = np.bincount(stitch_owner, minlength=len(running))
+    pieces = np.split(stitches, np.cumsum(counts)[:-1])
+    for i, coords in zip(running, pieces):
+        if len(coords) >= 2:
+            resampled[i] = strokes[i].replace(coordinates=coords, stitch='running')
+    return resampled
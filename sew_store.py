@@ -0,0 +1,219 @@
+"""Write-behind storage for drawings received by the server
+
+Saving used to write and fsync each file inside its own request, and a
+crash mid-write left a truncated drawing behind. SaveQueue hands the
+encoded bytes to one background thread, which writes each drawing to a
+hidden temp file beside its target and renames it into place, so a
+drawing file is either complete or absent. Saves that arrive while a
+batch is being written are written together as the next batch: every
+temp file is written, then each is fsynced, then all are renamed and the
+folder is fsynced once. put() returns a future the request waits on, so
+a save is only reported once it is on disk, and a failed write is
+reported as an error rather than lost. The futures are resolved before
+the batch is handed to on_saved (the catalog), so requests do not wait
+for that.
+"""
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent import futures
+
+# Saves waiting to be written before put() gives up
+QUEUE_SIZE = 64
+
+# At most BATCH_SIZE files share an fsync group; the writer waits up to
+# BATCH_WINDOW seconds for more saves after the first one arrives
+BATCH_SIZE = 32
+BATCH_WINDOW = 0.005
+
+# Longest a request waits for its save to reach the disk
+WRITE_TIMEOUT = 30
+
+class QueueFull(Exception):
+    """Raised when the writer has fallen too far behind to take a save"""
+
+def wait_saved(future, timeout=WRITE_TIMEOUT):
+    """File name a queued save was written as
+
+    Raises the error that stopped the write, or QueueFull if it is not
+    written within timeout seconds.
+    """
+    try:
+        return future.result(timeout)
+    except futures.TimeoutError:
+        raise QueueFull(f'save not written within {timeout}s') from None
+
+def _sync_folder(folder):
+    """fsync a directory so renames in it survive a crash (not on Windows)"""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(folder, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def install(temp_path, path):
+    """Rename a complete, fsynced temp file to path and make that durable"""
+    # mkstemp files are owner-only; drawings should be readable
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, path)
+    _sync_folder(os.path.dirname(os.path.abspath(path)))
+
+class SaveQueue:
+    """Bounded queue of drawing files written by one background thread
+
+    on_saved(saved) is called on the writer thread after each batch is
+    durably in place, with a list of (path, drawing) pairs; drawing is
+    the one passed to put().
+    """
+    def __init__(self, folder, on_saved=None, maxsize=QUEUE_SIZE,
+                 batch_size=BATCH_SIZE, window=BATCH_WINDOW):
+        self.folder = folder
+        self.on_saved = on_saved
+        self.batch_size = batch_size
+        self.window = window
+        self.queue = queue.Queue(maxsize)
+        # Content hash -> future of the save not yet written
+        self.queued = {}
+        self.queued_lock = threading.Lock()
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name='save-writer',
+                                       daemon=True)
+        self.thread.start()
+
+    def put(self, filename, data, drawing=None, key=None, timeout=5):
+        """Queue data (bytes) to be written as filename in the folder
+
+        Returns a future whose result is the file name once the file is
+        durably in place, or the OSError that stopped it, and whether the
+        save was a duplicate. key is the content hash of data; if a save
+        with the same key is already queued nothing is added and that
+        save's future is returned.
+        Blocks while the queue is full, for up to timeout seconds, then
+        raises QueueFull.
+        """
+        if self.closed:
+            raise RuntimeError('save queue is closed')
+        future = futures.Future()
+        if key is not None:
+            with self.queued_lock:
+                if key in self.queued:
+                    return self.queued[key], True
+                self.queued[key] = future
+        try:
+            self.queue.put((filename, data, drawing, key, future), timeout=timeout)
+        except queue.Full:
+            self._forget(key)
+            raise QueueFull(f'{self.queue.maxsize} saves are waiting to be '
+                            f'written') from None
+        return future, False
+
+    def queued_save(self, key):
+        """Future of the queued save with this content hash, or None"""
+        with self.queued_lock:
+            return self.queued.get(key)
+
+    def _forget(self, key):
+        if key is not None:
+            with self.queued_lock:
+                self.queued.pop(key, None)
+
+    def flush(self):
+        """Wait until every queued save is on disk"""
+        self.queue.join()
+
+    def close(self):
+        """Write what is queued and stop the writer; safe to call twice"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            batch = []
+            deadline = time.monotonic() + self.window
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get(
+                        timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+            for _ in range(len(batch) + (item is None)):
+                self.queue.task_done()
+            if item is None:
+                return
+
+    def _write_batch(self, batch):
+        """Write, fsync and rename a group of files, fsyncing the folder once"""
+        written = []
+        for filename, data, drawing, key, future in batch:
+            path = os.path.join(self.folder, filename)
+            try:
+                fd, temp_path = tempfile.mkstemp(
+                    prefix='.' + filename + '.', suffix='.tmp', dir=self.folder)
+            except OSError as e:
+                self._fail(filename, key, future, e)
+                continue
+            f = os.fdopen(fd, 'wb')
+            try:
+                f.write(data)
+                f.flush()
+            except OSError as e:
+                f.close()
+                os.remove(temp_path)
+                self._fail(filename, key, future, e)
+                continue
+            written.append((f, temp_path, path, drawing, key, future))
+
+        renamed = []
+        for f, temp_path, path, drawing, key, future in written:
+            try:
+                os.fsync(f.fileno())
+                f.close()
+                # mkstemp files are owner-only; drawings should be readable
+                os.chmod(temp_path, 0o644)
+                os.replace(temp_path, path)
+            except OSError as e:
+                f.close()
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                self._fail(os.path.basename(path), key, future, e)
+                continue
+            renamed.append((path, drawing, key, future))
+        if renamed:
+            try:
+                _sync_folder(self.folder)
+            except OSError as e:
+                # The renames may not survive a crash; let the clients retry
+                for path, drawing, key, future in renamed:
+                    self._fail(os.path.basename(path), key, future, e)
+                return
+
+        for path, drawing, key, future in renamed:
+            print(f"Saved drawing to: {path}")
+            future.set_result(os.path.basename(path))
+        if self.on_saved is not None and renamed:
+            try:
+                self.on_saved([(path, drawing)
+                               for path, drawing, key, future in renamed])
+            except Exception as e:
+                print(f"❌ Saved {len(renamed)} drawing(s) but could not "
+                      f"catalog them: {e}")
+        # Only now can duplicates be found in the catalog instead
+        for path, drawing, key, future in renamed:
+            self._forget(key)
+
+    def _fail(self, filename, key, future, error):
+        print(f"❌ Failed to save {filename}: {error}")
+        future.set_exception(error)
+        self._forget(key)
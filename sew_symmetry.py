@@ -0,0 +1,120 @@
+"""Mirror/symmetry expansion matching the drawing page
+
+sew.html stores only the touch path of each stroke plus its `mirror`
+mode; the mirrored copies are drawn on the Kindle but never saved.
+expand_strokes() regenerates those copies with the same math as the
+page's drawLine/drawDot, using NumPy over whole coordinate arrays.
+"""
+import numpy as np
+
+# Radial mode draws 8 copies at multiples of 45 degrees
+RADIAL_ANGLES = np.arange(8) * (np.pi / 4)
+
+# The page interpolates each move into steps of at most this many px
+STEP_PX = 2
+
+def _interpolate(coords):
+    """Split each segment into the sub-segments the page draws
+
+    Returns (starts, ends) arrays of shape (m, 2). Segments of zero
+    length are skipped, as the page draws nothing for them.
+    """
+    delta = np.diff(coords, axis=0)
+    dist = np.hypot(delta[:, 0], delta[:, 1])
+    steps = np.where(dist > 0, np.maximum(1, np.ceil(dist / STEP_PX)), 0).astype(np.intp)
+
+    segment = np.repeat(np.arange(len(delta)), steps)
+    first = np.repeat(np.cumsum(steps) - steps, steps)
+    index = np.arange(len(segment)) - first
+    count = steps[segment][:, None]
+
+    base = coords[segment]
+    step = delta[segment]
+    starts = base + step * (index[:, None] / count)
+    ends = base + step * ((index[:, None] + 1) / count)
+    return starts, ends
+
+def _radial_lines(coords, center):
+    """8 radial copies of a polyline, following drawLine
+
+    For every sub-segment the page puts the start on ray i at the start
+    point's radius and turns the end by the segment's own change in
+    angle, so each copy is emitted as start/end pairs.
+    """
+    starts, ends = _interpolate(coords)
+    rel_start = starts - center
+    rel_end = ends - center
+    dist1 = np.hypot(rel_start[:, 0], rel_start[:, 1])
+    dist2 = np.hypot(rel_end[:, 0], rel_end[:, 1])
+    angle_diff = (np.arctan2(rel_end[:, 1], rel_end[:, 0])
+                  - np.arctan2(rel_start[:, 1], rel_start[:, 0]))
+
+    new_angle = RADIAL_ANGLES[:, None]
+    end_angle = new_angle + angle_diff
+    copies = np.empty((len(RADIAL_ANGLES), 2 * len(starts), 2))
+    copies[:, 0::2, 0] = center[0] + np.cos(new_angle) * dist1
+    copies[:, 0::2, 1] = center[1] + np.sin(new_angle) * dist1
+    copies[:, 1::2, 0] = center[0] + np.cos(end_angle) * dist2
+    copies[:, 1::2, 1] = center[1] + np.sin(end_angle) * dist2
+    return list(copies)
+
+def _radial_dots(coords, center):
+    """8 radial copies of a dot, following drawDot"""
+    rel = coords[:1] - center
+    dist = np.hypot(rel[:, 0], rel[:, 1])
+    copies = np.empty((len(RADIAL_ANGLES), 1, 2))
+    copies[:, :, 0] = center[0] + np.cos(RADIAL_ANGLES)[:, None] * dist
+    copies[:, :, 1] = center[1] + np.sin(RADIAL_ANGLES)[:, None] * dist
+    return list(copies)
+
+def _reflections(coords, size, flips):
+    """Reflect coords across the canvas for each (flip_x, flip_y)"""
+    copies = []
+    for flip_x, flip_y in flips:
+        sign = np.array([-1.0 if flip_x else 1.0, -1.0 if flip_y else 1.0])
+        offset = np.where(sign < 0, size, 0.0)
+        copies.append(coords * sign + offset)
+    return copies
+
+def mirror_copies(stroke, width, height):
+    """Coordinate arrays of the mirrored copies of one stroke"""
+    mode = stroke.mirror
+    coords = np.asarray(stroke.coordinates, dtype=np.float64).reshape(-1, 2)
+    if len(coords) == 0:
+        return []
+
+    size = np.array([width, height], dtype=np.float64)
+    is_dot = stroke.type == 'dot'
+    if not is_dot and len(coords) < 2:
+        return []
+
+    if mode == 'bilateral':
+        return _reflections(coords[:1] if is_dot else coords, size, [(True, False)])
+    if mode == 'quad':
+        return _reflections(coords[:1] if is_dot else coords, size,
+                            [(True, False), (False, True), (True, True)])
+    if mode == 'radial':
+        center = size / 2
+        if is_dot:
+            return _radial_dots(coords, center)
+        return _radial_lines(coords, center)
+    return []
+
+def expand_strokes(strokes, width, height):
+    """Return strokes with every mirrored copy inserted after its original
+
+    Copies are made with stroke.replace() (mirror 'none', mirror_of set
+    to the original's index) and hold (n, 2) float arrays, which keeps
+    radial mode's 8x growth cheap. Without a canvas size the mirror axes
+    are unknown and strokes are returned unchanged.
+    """
+    if not width or not height:
+        return list(strokes)
+
+    expanded = []
+    for index, stroke in enumerate(strokes):
+        expanded.append(stroke)
+        for coords in mirror_copies(stroke, width, height):
+            expanded.append(stroke.replace(coordinates=coords, mirror='none',
+                                           mirror_of=index))
+    return expanded
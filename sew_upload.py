@@ -0,0 +1,332 @@
+"""Resumable drawing uploads, one stroke at a time
+
+A large radial drawing is megabytes of JSON, and /save_drawing needs all
+of it in one request: the whole body is held in memory, and a dropped
+connection loses every stroke. An upload instead receives the strokes as
+NDJSON, one stroke object per line, over as many requests as it takes.
+Each complete line is appended to a file as it arrives, so memory holds
+one stroke at a time, and every request is answered with the number of
+strokes safely on disk. After an interruption the client asks for that
+number and carries on from there.
+
+A page can also keep an upload open as a session while the drawing
+grows, sending only the strokes added since the count the server last
+acknowledged; nothing already stored is sent or written again.
+
+Uploads live in UPLOAD_FOLDER inside the drawings folder, as the drawing
+fields (<id>.header.json) and the strokes (<id>.ndjson). read() turns
+them into the same JSON /save_drawing writes, in one pass over the
+strokes.
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from sew_model import stroke_pen
+
+UPLOAD_FOLDER = '.uploads'
+
+# Longest stroke line accepted, and how much of a request is read at once
+MAX_LINE_BYTES = 16 * 1024 * 1024
+READ_SIZE = 64 * 1024
+
+# Unfinished uploads untouched for this long are removed, checking at
+# most every EXPIRE_INTERVAL seconds
+UPLOAD_MAX_AGE = 7 * 24 * 3600
+EXPIRE_INTERVAL = 3600
+
+class UploadError(ValueError):
+    """Raised for upload requests that cannot be applied"""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def read_lines(stream, max_line=MAX_LINE_BYTES):
+    """Complete lines from a binary stream, read READ_SIZE bytes at a time
+
+    A last line without a newline is yielded once the stream ends. If
+    reading fails (a dropped connection) the unfinished line is lost and
+    the error propagates.
+    """
+    parts, size = [], 0
+    while True:
+        chunk = stream.read(READ_SIZE)
+        if not chunk:
+            break
+        lines = chunk.split(b'\n')
+        for line in lines[:-1]:
+            if size + len(line) > max_line:
+                raise UploadError(f'stroke line longer than {max_line} bytes', 413)
+            parts.append(line)
+            yield b''.join(parts)
+            parts, size = [], 0
+        parts.append(lines[-1])
+        size += len(lines[-1])
+        if size > max_line:
+            raise UploadError(f'stroke line longer than {max_line} bytes', 413)
+    if size:
+        yield b''.join(parts)
+
+def last_lines(path, count):
+    """The last count lines of a file of whole lines, without newlines"""
+    if not count:
+        return []
+    with open(path, 'rb') as f:
+        position = f.seek(0, os.SEEK_END)
+        chunks = []
+        newlines = 0
+        # One newline more than count, so the first line is complete
+        while position and newlines <= count:
+            step = min(position, READ_SIZE)
+            position -= step
+            f.seek(position)
+            chunks.append(f.read(step))
+            newlines += chunks[-1].count(b'\n')
+    return b''.join(reversed(chunks)).split(b'\n')[:-1][-count:]
+
+class Upload:
+    """One unfinished upload; received counts the strokes on disk"""
+    __slots__ = ('id', 'header', 'received', 'header_path', 'strokes_path',
+                 'lock', 'closed')
+
+    def __init__(self, folder, upload_id, header, received=0):
+        self.id = upload_id
+        self.header = header
+        self.received = received
+        self.header_path = os.path.join(folder, upload_id + '.header.json')
+        self.strokes_path = os.path.join(folder, upload_id + '.ndjson')
+        self.lock = threading.Lock()
+        self.closed = False
+
+class UploadStore:
+    """Unfinished uploads kept in UPLOAD_FOLDER inside folder"""
+    def __init__(self, folder):
+        self.folder = os.path.join(folder, UPLOAD_FOLDER)
+        os.makedirs(self.folder, exist_ok=True)
+        self.uploads = {}
+        self.lock = threading.Lock()
+        self.expired_at = 0
+
+    def create(self, header):
+        """Start an upload for a drawing with these fields
+
+        Strokes already in header['strokes'] become the first strokes of
+        the upload.
+        """
+        if not isinstance(header, dict):
+            raise UploadError('the upload header must be a JSON object')
+        strokes = header.get('strokes') or []
+        if not isinstance(strokes, list):
+            raise UploadError("'strokes' must be a list")
+        header = dict(header)
+        if 'strokes' in header:
+            header['strokes'] = []
+
+        if time.time() - self.expired_at > EXPIRE_INTERVAL:
+            self.expire()
+        upload = Upload(self.folder, uuid.uuid4().hex, header)
+        open(upload.strokes_path, 'wb').close()
+        self._write_header(upload)
+        with self.lock:
+            self.uploads[upload.id] = upload
+        if strokes:
+            self.append(upload, (json.dumps(stroke).encode('utf-8')
+                                 for stroke in strokes))
+        return upload
+
+    def _write_header(self, upload):
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.folder)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(upload.header, f)
+        os.replace(temp_path, upload.header_path)
+
+    def update(self, upload, fields):
+        """Change drawing fields (the timestamp of the final save, say)
+
+        Fields keep their place in the saved JSON; strokes cannot be set
+        this way.
+        """
+        if not isinstance(fields, dict):
+            raise UploadError('drawing fields must be a JSON object')
+        if 'strokes' in fields:
+            raise UploadError('strokes are sent to /strokes, not with the fields')
+        with upload.lock:
+            if upload.closed:
+                raise UploadError('no such upload', 404)
+            upload.header.update(fields)
+            self._write_header(upload)
+
+    def get(self, upload_id):
+        """Upload by id, reloaded from disk after a restart
+
+        Raises UploadError (404) for unknown ids.
+        """
+        if not re.fullmatch('[0-9a-f]{32}', upload_id):
+            raise UploadError('no such upload', 404)
+        with self.lock:
+            upload = self.uploads.get(upload_id)
+            if upload is not None:
+                return upload
+            try:
+                with open(os.path.join(self.folder, upload_id + '.header.json')) as f:
+                    header = json.load(f)
+            except FileNotFoundError:
+                raise UploadError('no such upload', 404) from None
+            upload = Upload(self.folder, upload_id, header)
+            upload.received = self._recover(upload.strokes_path)
+            self.uploads[upload_id] = upload
+            return upload
+
+    def _recover(self, path):
+        """Count the complete lines in a strokes file, dropping a torn last one"""
+        count = size = end = 0
+        with open(path, 'rb+') as f:
+            while True:
+                chunk = f.read(READ_SIZE)
+                if not chunk:
+                    break
+                newlines = chunk.count(b'\n')
+                if newlines:
+                    count += newlines
+                    end = size + chunk.rindex(b'\n') + 1
+                size += len(chunk)
+            if end != size:
+                f.truncate(end)
+        return count
+
+    def append(self, upload, lines, start=None):
+        """Append stroke lines (bytes) to an upload; returns its stroke count
+
+        start is the index of the first stroke in lines; anything but a
+        non-negative int raises UploadError (400). Strokes the upload
+        already has are skipped, so resending a request is harmless, but
+        they must be the strokes it has: a stale start that would drop new
+        strokes, or one past the end, raises UploadError (409). Every
+        line must be a JSON object. Strokes written before an error or a
+        dropped connection are kept, and all of them are on disk before
+        this returns or raises.
+        """
+        if start is not None and (not isinstance(start, int)
+                                  or isinstance(start, bool) or start < 0):
+            raise UploadError(f'from must be a stroke index (0 or more), '
+                              f'not {start!r}')
+        with upload.lock:
+            if upload.closed:
+                raise UploadError('upload is already finished', 409)
+            if start is None:
+                start = upload.received
+            if start > upload.received:
+                raise UploadError(f'upload has {upload.received} strokes; '
+                                  f'cannot continue from stroke {start}', 409)
+            skip = upload.received - start
+            stored = iter(last_lines(upload.strokes_path, skip))
+            with open(upload.strokes_path, 'ab') as f:
+                good = f.tell()
+                try:
+                    for line in lines:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            stroke = json.loads(line)
+                        except ValueError:
+                            stroke = None
+                        if skip:
+                            if stroke != json.loads(next(stored)):
+                                raise UploadError(
+                                    f'stroke {upload.received - skip} differs '
+                                    f'from the one already received; send '
+                                    f'from {upload.received}', 409)
+                            skip -= 1
+                            continue
+                        if not isinstance(stroke, dict):
+                            raise UploadError(f'stroke {upload.received} is '
+                                              f'not a JSON object')
+                        f.write(line + b'\n')
+                        good += len(line) + 1
+                        upload.received += 1
+                finally:
+                    # Keep only whole lines, and make them durable
+                    f.flush()
+                    if f.tell() != good:
+                        f.truncate(good)
+                    os.fsync(f.fileno())
+                    os.utime(upload.header_path)
+            return upload.received
+
+    def read(self, upload, write=None):
+        """Read an upload's strokes back; call with upload.lock held
+
+        Returns their coordinate arrays and pens. If write is given, it
+        receives the drawing as bytes, piece by piece, exactly as
+        json.dumps(drawing, indent=2) would write it; the strokes are
+        parsed once for both.
+        """
+        arrays, pens = [], []
+        header = upload.header
+        keys = list(header)
+        if 'strokes' not in header:
+            keys.append('strokes')
+        if write:
+            write(b'{')
+        for i, key in enumerate(keys):
+            if write:
+                write(('\n  ' + json.dumps(key) + ': ').encode('utf-8'))
+            if key == 'strokes':
+                with open(upload.strokes_path, 'rb') as f:
+                    for line in f:
+                        stroke = json.loads(line)
+                        if write:
+                            write((',\n    ' if arrays else '[\n    ').encode('utf-8')
+                                  + json.dumps(stroke, indent=2)
+                                  .replace('\n', '\n    ').encode('utf-8'))
+                        arrays.append(np.asarray(stroke.get('coordinates', ()),
+                                                 dtype=np.float32).reshape(-1, 2))
+                        pens.append(stroke_pen(stroke))
+                if write:
+                    write(b'\n  ]' if arrays else b'[]')
+            elif write:
+                write(json.dumps(header[key], indent=2)
+                      .replace('\n', '\n  ').encode('utf-8'))
+            if write and i < len(keys) - 1:
+                write(b',')
+        if write:
+            write(b'\n}')
+        return arrays, pens
+
+    def discard(self, upload):
+        """Forget an upload and delete its files"""
+        upload.closed = True
+        with self.lock:
+            self.uploads.pop(upload.id, None)
+        for path in (upload.header_path, upload.strokes_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def expire(self, max_age=UPLOAD_MAX_AGE):
+        """Delete uploads nobody has added to for max_age seconds
+
+        Runs at startup and then from create(), so abandoned sessions
+        do not pile up while the server keeps running.
+        """
+        self.expired_at = time.time()
+        cutoff = self.expired_at - max_age
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith('.header.json') and entry.stat().st_mtime < cutoff:
+                upload_id = entry.name[:-len('.header.json')]
+                with self.lock:
+                    upload = self.uploads.get(upload_id)
+                if upload is None:
+                    upload = Upload(self.folder, upload_id, None)
+                # Leave it alone if a request is using it right now
+                if upload.lock.acquire(blocking=False):
+                    try:
+                        self.discard(upload)
+                    finally:
+                        upload.lock.release()
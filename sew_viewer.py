@@ -1,77 +1,741 @@
 import sys
-import json
 import os
+from collections import OrderedDict
+
+import numpy as np
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
-                             QHBoxLayout, QPushButton, QListWidget, QLabel,
-                             QMessageBox, QFileDialog)
-from PyQt6.QtCore import Qt, QPointF
-from PyQt6.QtGui import QPainter, QPen, QColor, QBrush
-import pystitch
+                             QHBoxLayout, QPushButton, QListView, QLabel,
+                             QMessageBox, QFileDialog, QProgressBar)
+from PyQt6.QtCore import (Qt, QPointF, QObject, QRunnable, QThreadPool,
+                          QAbstractListModel, QModelIndex, QFileSystemWatcher,
+                          QTimer, pyqtSignal)
+from PyQt6.QtGui import (QPainter, QPen, QColor, QBrush, QPixmap,
+                         QPainterPath, QPolygonF)
+from sew_catalog import SETTLE_SECONDS, Catalog
+from sew_model import (export_formats, load_drawing_file, plan_for,
+                       ExportCancelled, WRITERS)
+from sew_plan import describe_report
+
+# Folder watching: reconcile once changes have been quiet for
+# WATCH_DEBOUNCE_MS; files still settling (see sew_catalog.SETTLE_SECONDS)
+# are tried again
+WATCH_DEBOUNCE_MS = 300
+
+def simplify_polyline(coords, tolerance):
+    """Simplify a polyline so it stays within tolerance of the original
+    
+    A radial-distance pass drops points closer than tolerance / 2 to the
+    last kept one, then Ramer-Douglas-Peucker with tolerance / 2 removes
+    points that barely bend the line, so the combined error is bounded
+    by tolerance.
+    """
+    if hasattr(coords, 'tolist'):
+        coords = coords.tolist()
+    if len(coords) < 3:
+        return [tuple(point) for point in coords]
+        
+    half = tolerance / 2
+    half_sq = half * half
+    
+    # Radial-distance decimation
+    last_x, last_y = coords[0]
+    points = [(last_x, last_y)]
+    for x, y in coords[1:-1]:
+        if (x - last_x) ** 2 + (y - last_y) ** 2 > half_sq:
+            points.append((x, y))
+            last_x, last_y = x, y
+    points.append(tuple(coords[-1]))
+    
+    # Ramer-Douglas-Peucker without recursion
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        ax, ay = points[first]
+        dx = points[last][0] - ax
+        dy = points[last][1] - ay
+        length_sq = dx * dx + dy * dy
+        
+        max_dist_sq = half_sq
+        split = None
+        for i in range(first + 1, last):
+            px = points[i][0] - ax
+            py = points[i][1] - ay
+            if length_sq:
+                cross = px * dy - py * dx
+                dist_sq = cross * cross / length_sq
+            else:
+                dist_sq = px * px + py * py
+            if dist_sq > max_dist_sq:
+                max_dist_sq = dist_sq
+                split = i
+                
+        if split is not None:
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+            
+    return [point for point, kept in zip(points, keep) if kept]
+
+class StrokeGrid:
+    """Uniform grid of stroke bounding boxes for visible-rect queries"""
+    def __init__(self, bboxes, divisions=64):
+        self.bboxes = bboxes
+        self.cells = {}
+        
+        boxes = [b for b in bboxes if b is not None]
+        if not boxes:
+            self.extent = (0.0, 0.0, 0.0, 0.0)
+            self.cell_size = 1.0
+            return
+            
+        min_x = min(b[0] for b in boxes)
+        min_y = min(b[1] for b in boxes)
+        max_x = max(b[2] for b in boxes)
+        max_y = max(b[3] for b in boxes)
+        self.extent = (min_x, min_y, max_x, max_y)
+        self.cell_size = max(max_x - min_x, max_y - min_y, 1.0) / divisions
+        
+        for index, bbox in enumerate(bboxes):
+            if bbox is None:
+                continue
+            for cell in self._cells_for(*bbox):
+                self.cells.setdefault(cell, []).append(index)
+                
+    def _cells_for(self, x1, y1, x2, y2):
+        ox, oy = self.extent[:2]
+        size = self.cell_size
+        for cx in range(int((x1 - ox) // size), int((x2 - ox) // size) + 1):
+            for cy in range(int((y1 - oy) // size), int((y2 - oy) // size) + 1):
+                yield (cx, cy)
+                
+    def query(self, x1, y1, x2, y2):
+        """Return sorted indices of strokes whose bbox intersects the rect"""
+        # Clamp the rect to the indexed extent so zooming out stays cheap
+        min_x, min_y, max_x, max_y = self.extent
+        x1, y1 = max(x1, min_x), max(y1, min_y)
+        x2, y2 = min(x2, max_x), min(y2, max_y)
+        if not self.cells or x1 > x2 or y1 > y2:
+            return []
+                
+        found = set()
+        for cell in self._cells_for(x1, y1, x2, y2):
+            for index in self.cells.get(cell, ()):
+                if index in found:
+                    continue
+                bx1, by1, bx2, by2 = self.bboxes[index]
+                if bx1 <= x2 and bx2 >= x1 and by1 <= y2 and by2 >= y1:
+                    found.add(index)
+        return sorted(found)
 
 class EmbroideryCanvas(QWidget):
     """Widget to display the embroidery preview"""
+    MIN_ZOOM = 0.02
+    MAX_ZOOM = 64.0
+    
+    # How many pen runs back a stroke may move to join one of its own pen
+    RUN_LOOKBACK = 8
+    
+    # Simplification tolerances in drawing units, finest first
+    LOD_TOLERANCES = (0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+    # Largest error allowed on screen, in device pixels
+    LOD_MAX_ERROR = 0.5
+    
     def __init__(self):
         super().__init__()
-        self.drawing_data = None
+        self.drawing = None
         self.setMinimumSize(600, 600)
         
-    def load_drawing(self, data):
-        """Load drawing data from JSON"""
-        self.drawing_data = data
+        # Rendered preview, reused until the drawing, view, size or DPR changes
+        self._drawing_version = 0
+        self._cache_key = None
+        self._cache_pixmap = None
+        
+        # 'batched' draws one polyline per stroke grouped by pen,
+        # 'segments' is the original one-drawLine-per-point renderer
+        self.render_mode = 'batched'
+        self._batches = None
+        self._grid = None
+        
+        # Simplified polylines per LOD level, filled lazily per stroke
+        self._lod = {}
+        self.points_drawn = 0
+        
+        # Viewport: None zoom means fit-to-window, otherwise explicit scale
+        # with the drawing origin placed at self.offset (widget coords)
+        self.zoom = None
+        self.offset = QPointF(0, 0)
+        self._drag_pos = None
+        
+    def load_drawing(self, drawing):
+        """Show a parsed Drawing"""
+        self.drawing = drawing
+        self._drawing_version += 1
+        self._batches = None
+        self._grid = None
+        self._lod = {}
+        self.zoom = None
+        self.offset = QPointF(0, 0)
+        self.invalidate_cache()
         self.update()
         
+    def invalidate_cache(self):
+        """Drop the cached preview so the next paint re-renders it"""
+        self._cache_key = None
+        self._cache_pixmap = None
+        
+    def resizeEvent(self, event):
+        """Re-render on the next paint only if the size really changed"""
+        if self._cache_key and self._cache_key[1] != (self.width(), self.height()):
+            self.invalidate_cache()
+        super().resizeEvent(event)
+        
     def paintEvent(self, event):
-        """Paint the drawing preview"""
-        if not self.drawing_data:
+        """Paint the drawing preview from the cached pixmap"""
+        if not self.drawing:
             return
             
+        dpr = self.devicePixelRatioF()
+        offset = self.view_offset()
+        key = (self._drawing_version, (self.width(), self.height()), dpr,
+               self.view_scale(), offset.x(), offset.y())
+        if key != self._cache_key or self._cache_pixmap is None:
+            self._cache_pixmap = self.render_pixmap(dpr)
+            self._cache_key = key
+            
         painter = QPainter(self)
-        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.drawPixmap(0, 0, self._cache_pixmap)
+        painter.end()
+        
+    def render_pixmap(self, dpr):
+        """Render the visible part of the drawing into a widget-sized pixmap"""
+        pixmap = QPixmap(max(1, round(self.width() * dpr)),
+                         max(1, round(self.height() * dpr)))
+        pixmap.setDevicePixelRatio(dpr)
         
         # Fill background
-        painter.fillRect(self.rect(), QColor(255, 255, 255))
+        pixmap.fill(QColor(255, 255, 255))
+        
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        self.draw_strokes(painter)
+        painter.end()
+        return pixmap
+        
+    def set_render_mode(self, mode):
+        """Switch between 'batched' and 'segments' rendering"""
+        if mode not in ('batched', 'segments'):
+            raise ValueError(f'Unknown render mode: {mode}')
+        self.render_mode = mode
+        self.invalidate_cache()
+        self.update()
+        
+    def fit_scale(self):
+        """Scale that fits the drawing into the widget"""
+        if self.drawing.width and self.drawing.height:
+            scale_x = self.width() / self.drawing.width
+            scale_y = self.height() / self.drawing.height
+            return min(scale_x, scale_y, 1.0)  # Don't scale up, only down
+        return 1.0
+        
+    def view_scale(self):
+        """Current drawing-to-widget scale"""
+        if self.zoom is None:
+            return self.fit_scale() if self.drawing else 1.0
+        return self.zoom
+        
+    def view_offset(self):
+        """Widget position of the drawing origin"""
+        if self.zoom is None:
+            return QPointF(0, 0)
+        return self.offset
+        
+    def visible_rect(self):
+        """Visible area in drawing coordinates as (x1, y1, x2, y2)"""
+        scale = self.view_scale()
+        offset = self.view_offset()
+        x1 = -offset.x() / scale
+        y1 = -offset.y() / scale
+        return (x1, y1, x1 + self.width() / scale, y1 + self.height() / scale)
+        
+    def set_view(self, zoom, offset):
+        """Apply an explicit zoom and offset and repaint"""
+        self.zoom = max(self.MIN_ZOOM, min(self.MAX_ZOOM, zoom))
+        self.offset = QPointF(offset)
+        self.update()
+        
+    def fit_to_window(self):
+        """Return to the fit-to-window view"""
+        self.zoom = None
+        self.offset = QPointF(0, 0)
+        self.update()
+        
+    def actual_size(self):
+        """Show the drawing at 1:1, keeping the widget centre in place"""
+        self.zoom_to(1.0, QPointF(self.width() / 2, self.height() / 2))
+        
+    def zoom_to(self, zoom, anchor):
+        """Zoom so the drawing point under anchor stays under it"""
+        if not self.drawing:
+            return
+        scale = self.view_scale()
+        offset = self.view_offset()
+        zoom = max(self.MIN_ZOOM, min(self.MAX_ZOOM, zoom))
+        # Drawing point currently under the anchor
+        px = (anchor.x() - offset.x()) / scale
+        py = (anchor.y() - offset.y()) / scale
+        self.set_view(zoom, QPointF(anchor.x() - px * zoom,
+                                    anchor.y() - py * zoom))
+        
+    def zoom_by(self, factor, anchor=None):
+        """Multiply the current zoom by factor around anchor"""
+        if anchor is None:
+            anchor = QPointF(self.width() / 2, self.height() / 2)
+        self.zoom_to(self.view_scale() * factor, anchor)
+        
+    def wheelEvent(self, event):
+        """Zoom around the cursor with the mouse wheel"""
+        steps = event.angleDelta().y() / 120
+        if steps:
+            self.zoom_by(1.25 ** steps, event.position())
+        event.accept()
+        
+    def mousePressEvent(self, event):
+        """Start panning with the left button"""
+        if event.button() == Qt.MouseButton.LeftButton and self.drawing:
+            self._drag_pos = event.position()
+            self.setCursor(Qt.CursorShape.ClosedHandCursor)
+        super().mousePressEvent(event)
+        
+    def mouseMoveEvent(self, event):
+        """Pan the view while dragging"""
+        if self._drag_pos is not None:
+            delta = event.position() - self._drag_pos
+            self._drag_pos = event.position()
+            self.set_view(self.view_scale(), self.view_offset() + delta)
+        super().mouseMoveEvent(event)
+        
+    def mouseReleaseEvent(self, event):
+        """Stop panning"""
+        if event.button() == Qt.MouseButton.LeftButton:
+            self._drag_pos = None
+            self.unsetCursor()
+        super().mouseReleaseEvent(event)
         
-        # Calculate scaling to fit widget
-        if self.drawing_data.get('width') and self.drawing_data.get('height'):
-            scale_x = self.width() / self.drawing_data['width']
-            scale_y = self.height() / self.drawing_data['height']
-            scale = min(scale_x, scale_y, 1.0)  # Don't scale up, only down
+    def mouseDoubleClickEvent(self, event):
+        """Double-click returns to fit-to-window"""
+        self.fit_to_window()
+        
+    def draw_strokes(self, painter):
+        """Draw the strokes that intersect the visible area"""
+        visible = self.stroke_grid().query(*self.visible_rect())
+        
+        scale = self.view_scale()
+        offset = self.view_offset()
+        painter.translate(offset)
+        painter.scale(scale, scale)
+        
+        if self.render_mode == 'segments':
+            self.draw_strokes_segments(painter, visible)
         else:
-            scale = 1.0
+            level = self.lod_level(scale * painter.device().devicePixelRatioF())
+            self.draw_strokes_batched(painter, visible, level)
+            
+    def lod_level(self, device_scale):
+        """Coarsest LOD level whose error stays below LOD_MAX_ERROR
+        
+        Returns None when only the full-resolution polyline is exact.
+        """
+        allowed = self.LOD_MAX_ERROR / device_scale
+        level = None
+        for index, tolerance in enumerate(self.LOD_TOLERANCES):
+            if tolerance > allowed:
+                break
+            level = index
+        return level
+        
+    def stroke_polyline(self, index, level):
+        """Polyline for a stroke at a LOD level (None = full resolution)
+        
+        Built on first use and cached, so strokes that are never visible
+        at a level never pay for it.
+        """
+        cache = self._lod.setdefault(level, {})
+        polyline = cache.get(index)
+        if polyline is None:
+            coords = self.drawing.strokes[index].coordinates
+            if level is None:
+                points = coords.tolist() if hasattr(coords, 'tolist') else coords
+            else:
+                points = simplify_polyline(coords, self.LOD_TOLERANCES[level])
+            polyline = QPolygonF([QPointF(x, y) for x, y in points])
+            cache[index] = polyline
+        return polyline
             
-        # Draw each stroke
-        for stroke in self.drawing_data.get('strokes', []):
-            color = QColor(stroke['color'])
-            width = stroke['width'] * scale
-            coords = stroke['coordinates']
+    def stroke_grid(self):
+        """Spatial index over stroke bounding boxes, built once per drawing"""
+        if self._grid is None:
+            bounds = self.drawing.stroke_bounds()
+            # Pad by the pen radius so thick strokes aren't culled early
+            pad = np.array([stroke.width for stroke in self.drawing.strokes],
+                           dtype=np.float64) / 2
+            bounds += pad[:, None] * [-1, -1, 1, 1]
+            bboxes = [None if np.isnan(box[0]) else tuple(box)
+                      for box in bounds.tolist()]
+            self._grid = StrokeGrid(bboxes)
+        return self._grid
+        
+    def build_batches(self):
+        """Assign each stroke to a (color, width) pen group
+        
+        Dots keep their centre; polylines are built lazily per LOD level
+        by stroke_polyline. Everything is in drawing coordinates and the
+        painter transform applies the view, so zooming and panning
+        reuse it.
+        """
+        pens = {}
+        items = []
+        for stroke in self.drawing.strokes:
+            coords = stroke.coordinates
+            key = (stroke.color, stroke.width)
+            group = pens.setdefault(key, len(pens))
+            
+            if len(coords) == 0:
+                items.append(None)
+            elif stroke.type == 'dot':
+                x, y = coords[0]
+                items.append((group, True, QPointF(x, y)))
+            elif len(coords) > 1:
+                items.append((group, False, None))
+            else:
+                items.append(None)
+                
+        groups = [(QColor(color), width) for color, width in pens]
+        return groups, items
+        
+    def draw_strokes_batched(self, painter, visible, level=None):
+        """Draw strokes in runs that share a pen, keeping what is on top
+        
+        A stroke joins an earlier run of its pen only if it does not
+        overlap any stroke of another pen painted since, so the picture is
+        the same as painting in drawing order (a white stroke still covers
+        the black one under it).
+        """
+        if self._batches is None:
+            self._batches = self.build_batches()
+        groups, items = self._batches
+        bboxes = self.stroke_grid().bboxes
+        
+        # Runs in paint order: [group, x1, y1, x2, y2, polylines, dots]
+        points_drawn = 0
+        runs = []
+        for index in visible:
+            item = items[index]
+            if item is None:
+                continue
+            group, is_dot, geometry = item
+            x1, y1, x2, y2 = bboxes[index]
+            run = None
+            for earlier in reversed(runs[-self.RUN_LOOKBACK:]):
+                if earlier[0] == group:
+                    run = earlier
+                    break
+                if earlier[1] <= x2 and earlier[3] >= x1 and earlier[2] <= y2 and earlier[4] >= y1:
+                    break
+            if run is None:
+                run = [group, x1, y1, x2, y2, [], []]
+                runs.append(run)
+            else:
+                run[1:5] = min(run[1], x1), min(run[2], y1), max(run[3], x2), max(run[4], y2)
+            if is_dot:
+                run[6].append(geometry)
+            else:
+                run[5].append(self.stroke_polyline(index, level))
+                
+        for group, _, _, _, _, polylines, dots in runs:
+            color, width = groups[group]
+            pen = QPen(color, width, Qt.PenStyle.SolidLine,
+                      Qt.PenCapStyle.RoundCap, Qt.PenJoinStyle.RoundJoin)
+            painter.setPen(pen)
+            
+            painter.setBrush(Qt.BrushStyle.NoBrush)
+            for polyline in polylines:
+                painter.drawPolyline(polyline)
+                points_drawn += polyline.size()
+                
+            if dots:
+                path = QPainterPath()
+                half = width / 2
+                for center in dots:
+                    path.addEllipse(center, half, half)
+                painter.setBrush(QBrush(color))
+                painter.drawPath(path)
+                points_drawn += len(dots)
+                
+        self.points_drawn = points_drawn
+        
+    def draw_strokes_segments(self, painter, visible):
+        """Draw every visible stroke one line segment at a time"""
+        strokes = self.drawing.strokes
+        for index in visible:
+            stroke = strokes[index]
+            color = QColor(stroke.color)
+            width = stroke.width
+            coords = stroke.coordinates
             
             pen = QPen(color, width, Qt.PenStyle.SolidLine, 
                       Qt.PenCapStyle.RoundCap, Qt.PenJoinStyle.RoundJoin)
             painter.setPen(pen)
             
-            if stroke.get('type') == 'dot':
+            if stroke.type == 'dot':
                 # Draw dot
-                if coords:
+                if len(coords):
                     x, y = coords[0]
                     painter.setBrush(QBrush(color))
-                    painter.drawEllipse(QPointF(x * scale, y * scale), 
-                                      width / 2, width / 2)
+                    painter.drawEllipse(QPointF(x, y), width / 2, width / 2)
             else:
                 # Draw line
                 if len(coords) > 1:
                     for i in range(len(coords) - 1):
                         x1, y1 = coords[i]
                         x2, y2 = coords[i + 1]
-                        painter.drawLine(QPointF(x1 * scale, y1 * scale),
-                                       QPointF(x2 * scale, y2 * scale))
+                        painter.drawLine(QPointF(x1, y1), QPointF(x2, y2))
+
+def file_key(filepath):
+    """Cache key that changes whenever the file is rewritten"""
+    stat = os.stat(filepath)
+    return (filepath, stat.st_mtime_ns, stat.st_size)
+
+class DrawingCache:
+    """Small LRU of Drawings keyed by (path, mtime, size)"""
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        
+    def get(self, key):
+        """Return the cached drawing for key, or None"""
+        drawing = self._entries.get(key)
+        if drawing is not None:
+            self._entries.move_to_end(key)
+        return drawing
+        
+    def put(self, key, drawing):
+        """Store a drawing, evicting the least recently used ones"""
+        self._entries[key] = drawing
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            
+    def __contains__(self, key):
+        return key in self._entries
+        
+    def discard(self, paths):
+        """Drop every cached version of the given file paths"""
+        for key in [key for key in self._entries if key[0] in paths]:
+            del self._entries[key]
+
+class LoaderSignals(QObject):
+    """Signals emitted by DrawingLoader back to the GUI thread"""
+    loaded = pyqtSignal(object, object)  # key, Drawing
+    failed = pyqtSignal(object, str)     # key, error message
+
+class DrawingLoader(QRunnable):
+    """Read and parse a drawing file on a thread pool worker"""
+    def __init__(self, key):
+        super().__init__()
+        self.key = key
+        self.cancelled = False
+        self.signals = LoaderSignals()
+        
+    def cancel(self):
+        """Ask the worker to drop its result; it never touches the GUI"""
+        self.cancelled = True
+        
+    def run(self):
+        if self.cancelled:
+            return
+        try:
+            drawing = load_drawing_file(self.key[0])
+            # Expand mirror copies here rather than on the first paint
+            drawing.strokes
+        except Exception as e:
+            if not self.cancelled:
+                self.signals.failed.emit(self.key, str(e))
+            return
+        if not self.cancelled:
+            self.signals.loaded.emit(self.key, drawing)
+
+class DrawingListModel(QAbstractListModel):
+    """Drawing file names from the catalog, fetched a page at a time
+    
+    Only the rows scrolled into reach are held, so a folder of 100k
+    drawings costs a few hundred names until the user scrolls. refresh()
+    re-reads the loaded window and applies the difference as row
+    insertions and removals, which keeps the selection and scroll
+    position where they were.
+    """
+    PAGE = 500
+    
+    def __init__(self, catalog, parent=None):
+        super().__init__(parent)
+        self.catalog = catalog
+        self.names = []     # Loaded rows, most recent first
+        self.total = 0
+        
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.names)
+        
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and index.isValid():
+            return self.names[index.row()]
+        return None
+        
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and len(self.names) < self.total
+        
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        page = self.catalog.filenames(limit=self.PAGE,
+                                      after=self.names[-1] if self.names else None)
+        if not page:
+            # Rows were removed since total was counted
+            self.total = len(self.names)
+            return
+        start = len(self.names)
+        self.beginInsertRows(QModelIndex(), start, start + len(page) - 1)
+        self.names.extend(page)
+        self.endInsertRows()
+        
+    def name(self, row):
+        """File name at row, or None outside the loaded rows"""
+        return self.names[row] if 0 <= row < len(self.names) else None
+        
+    def refresh(self):
+        """Bring the loaded rows in line with the catalog"""
+        self.total = self.catalog.count()
+        if self.names:
+            names = self.catalog.filenames(through=self.names[-1])
+        else:
+            names = self.catalog.filenames(limit=self.PAGE)
+            
+        # Remove bottom-up so the rows above keep their numbers
+        keep = set(names)
+        row = len(self.names)
+        while row > 0:
+            if self.names[row - 1] in keep:
+                row -= 1
+                continue
+            end = row
+            while row > 0 and self.names[row - 1] not in keep:
+                row -= 1
+            self.beginRemoveRows(QModelIndex(), row, end - 1)
+            del self.names[row:end]
+            self.endRemoveRows()
+            
+        # The rows left are in the same order as names; fill in the gaps
+        present = set(self.names)
+        row = 0
+        while row < len(names):
+            if names[row] in present:
+                row += 1
+                continue
+            start = row
+            while row < len(names) and names[row] not in present:
+                row += 1
+            self.beginInsertRows(QModelIndex(), start, row - 1)
+            self.names[start:start] = names[start:row]
+            self.endInsertRows()
+            
+class CatalogSignals(QObject):
+    """Signals emitted by CatalogWorker back to the GUI thread"""
+    reconciled = pyqtSignal(object, object, object)  # changed, removed, pending names
+    failed = pyqtSignal(str)             # error message
+    
+class CatalogWorker(QRunnable):
+    """Reconcile the drawing catalog with its folder off the GUI thread"""
+    def __init__(self, catalog, force=False):
+        super().__init__()
+        self.catalog = catalog
+        self.force = force
+        self.signals = CatalogSignals()
+        
+    def run(self):
+        try:
+            changes = self.catalog.reconcile(self.force, SETTLE_SECONDS)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.reconciled.emit(*changes)
+            
+class ExportSignals(QObject):
+    """Signals emitted by ExportWorker back to the GUI thread"""
+    progress = pyqtSignal(int, int)      # done, total
+    finished = pyqtSignal(object, object, object)  # targets, timings, plan report
+    failed = pyqtSignal(str)             # error message
+    cancelled = pyqtSignal()
+
+class ExportWorker(QRunnable):
+    """Build the pattern once and write every target on a worker thread"""
+    def __init__(self, drawing, targets):
+        super().__init__()
+        self.drawing = drawing
+        self.targets = targets
+        self.cancel_requested = False
+        self.signals = ExportSignals()
+        
+    def cancel(self):
+        """Stop at the next stroke block; the target files are left untouched"""
+        self.cancel_requested = True
+        
+    def run(self):
+        try:
+            timings = export_formats(self.drawing, self.targets,
+                                     progress=self.signals.progress.emit,
+                                     is_cancelled=lambda: self.cancel_requested)
+        except ExportCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        else:
+            # The plan is memoized, so this is the one the export used
+            _, report = plan_for(self.drawing)
+            self.signals.finished.emit(self.targets, timings, report)
 
 class SewViewer(QMainWindow):
     """Main application window"""
     def __init__(self):
         super().__init__()
         self.current_file = None
+        self.current_drawing = None
         self.sew_folder = os.path.join(os.path.dirname(__file__), 'SewCustom')
         os.makedirs(self.sew_folder, exist_ok=True)
+        self.catalog = Catalog(self.sew_folder)
+        
+        # The folder is watched so new drawings appear while the viewer is
+        # open; bursts of changes are folded into one reconcile
+        self.watcher = QFileSystemWatcher([self.sew_folder], self)
+        self.watcher.directoryChanged.connect(self.schedule_reconcile)
+        self.reconcile_timer = QTimer(self)
+        self.reconcile_timer.setSingleShot(True)
+        self.reconcile_timer.timeout.connect(self.reconcile_catalog)
+        self.reconcile_running = False
+        self.reconcile_again = False
+        self.reconcile_force = False
+        
+        # Drawings are parsed off the GUI thread; the selected file and its
+        # list neighbours end up in a small LRU so browsing is instant
+        self.load_pool = QThreadPool(self)
+        self.load_pool.setMaxThreadCount(2)
+        self.drawing_cache = DrawingCache()
+        self.pending_loads = {}
+        self.wanted_key = None
+        
+        # Exports run one at a time on their own pool
+        self.export_pool = QThreadPool(self)
+        self.export_pool.setMaxThreadCount(1)
+        self.export_worker = None
         
         self.init_ui()
         self.load_file_list()
@@ -93,12 +757,19 @@ class SewViewer(QMainWindow):
         
         left_panel.addWidget(QLabel('Saved Drawings:'))
         
-        self.file_list = QListWidget()
-        self.file_list.itemClicked.connect(self.load_drawing)
+        self.file_model = DrawingListModel(self.catalog, self)
+        self.file_list = QListView()
+        # Rows are laid out without measuring each one, and in batches so
+        # a page arriving at the end of a long list does not stall scrolling
+        self.file_list.setUniformItemSizes(True)
+        self.file_list.setLayoutMode(QListView.LayoutMode.Batched)
+        self.file_list.setBatchSize(2000)
+        self.file_list.setModel(self.file_model)
+        self.file_list.selectionModel().currentChanged.connect(self.load_drawing)
         left_panel.addWidget(self.file_list)
         
         refresh_btn = QPushButton('🔄 Refresh List')
-        refresh_btn.clicked.connect(self.load_file_list)
+        refresh_btn.clicked.connect(lambda: self.load_file_list(force=True))
         left_panel.addWidget(refresh_btn)
         
         main_layout.addLayout(left_panel, 1)
@@ -106,9 +777,30 @@ class SewViewer(QMainWindow):
         # Right panel - preview and controls
         right_panel = QVBoxLayout()
         
-        right_panel.addWidget(QLabel('Preview:'))
+        # Preview header with zoom controls
+        view_layout = QHBoxLayout()
+        view_layout.addWidget(QLabel('Preview:'))
+        view_layout.addStretch()
         
         self.canvas = EmbroideryCanvas()
+        
+        zoom_out_btn = QPushButton('➖')
+        zoom_out_btn.clicked.connect(lambda: self.canvas.zoom_by(0.8))
+        view_layout.addWidget(zoom_out_btn)
+        
+        zoom_in_btn = QPushButton('➕')
+        zoom_in_btn.clicked.connect(lambda: self.canvas.zoom_by(1.25))
+        view_layout.addWidget(zoom_in_btn)
+        
+        fit_btn = QPushButton('Fit')
+        fit_btn.clicked.connect(self.canvas.fit_to_window)
+        view_layout.addWidget(fit_btn)
+        
+        actual_btn = QPushButton('1:1')
+        actual_btn.clicked.connect(self.canvas.actual_size)
+        view_layout.addWidget(actual_btn)
+        
+        right_panel.addLayout(view_layout)
         right_panel.addWidget(self.canvas)
         
         # Button panel
@@ -124,8 +816,27 @@ class SewViewer(QMainWindow):
         self.export_svg_btn.setEnabled(False)
         button_layout.addWidget(self.export_svg_btn)
         
+        self.export_all_btn = QPushButton('📦 Export All Formats')
+        self.export_all_btn.clicked.connect(self.export_all)
+        self.export_all_btn.setEnabled(False)
+        button_layout.addWidget(self.export_all_btn)
+        
         right_panel.addLayout(button_layout)
         
+        # Export progress, shown while an export is running
+        progress_layout = QHBoxLayout()
+        
+        self.export_progress = QProgressBar()
+        self.export_progress.setVisible(False)
+        progress_layout.addWidget(self.export_progress)
+        
+        self.cancel_export_btn = QPushButton('✖ Cancel')
+        self.cancel_export_btn.clicked.connect(self.cancel_export)
+        self.cancel_export_btn.setVisible(False)
+        progress_layout.addWidget(self.cancel_export_btn)
+        
+        right_panel.addLayout(progress_layout)
+        
         # Info label
         self.info_label = QLabel('Select a drawing file to preview')
         self.info_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
@@ -133,145 +844,271 @@ class SewViewer(QMainWindow):
         
         main_layout.addLayout(right_panel, 2)
         
-    def load_file_list(self):
-        """Load list of JSON files from SewCustom folder"""
-        self.file_list.clear()
+    def load_file_list(self, force=False):
+        """List drawings from the catalog, then reconcile it in the background
         
-        if not os.path.exists(self.sew_folder):
-            return
-            
-        files = [f for f in os.listdir(self.sew_folder) if f.endswith('.json')]
-        files.sort(reverse=True)  # Most recent first
+        The catalog already knows every drawing seen before, so the list
+        appears immediately; files added or removed since show up once
+        the folder has been checked (always rescanned when force is set).
+        """
+        self.show_file_list()
+        self.reconcile_catalog(force)
         
-        for filename in files:
-            self.file_list.addItem(filename)
-            
-        self.info_label.setText(f'Found {len(files)} drawing(s)')
+    def schedule_reconcile(self, path=None, delay=WATCH_DEBOUNCE_MS):
+        """Reconcile once the folder has been quiet for delay ms"""
+        self.reconcile_timer.start(delay)
+        
+    def reconcile_catalog(self, force=False):
+        """Check the folder in the background, one pass at a time"""
+        self.reconcile_force = self.reconcile_force or force
+        if self.reconcile_running:
+            # Changes seen during a pass get a pass of their own
+            self.reconcile_again = True
+            return
+        self.reconcile_running = True
+        worker = CatalogWorker(self.catalog, self.reconcile_force)
+        self.reconcile_force = False
+        worker.signals.reconciled.connect(self.on_catalog_reconciled)
+        worker.signals.failed.connect(self.on_catalog_failed)
+        self.load_pool.start(worker)
         
-    def load_drawing(self, item):
-        """Load and display selected drawing"""
-        filename = item.text()
-        filepath = os.path.join(self.sew_folder, filename)
+    def show_file_list(self):
+        """Update the list from the catalog, keeping the selected file"""
+        self.file_model.refresh()
+        self.info_label.setText(f'Found {self.file_model.total} drawing(s)')
         
-        try:
-            with open(filepath, 'r') as f:
-                data = json.load(f)
+    def on_catalog_reconciled(self, changed, removed, pending):
+        """Apply what reconciling found to the list and the drawing cache"""
+        self.finish_reconcile()
+        if pending:
+            # Still being written; look again once they have settled
+            self.schedule_reconcile(delay=int(SETTLE_SECONDS * 1000))
+        paths = {os.path.join(self.sew_folder, name) for name in changed + removed}
+        self.drawing_cache.discard(paths)
+        # The server catalogs its own saves, so the rows may have changed
+        # even when this pass found nothing new
+        self.file_model.refresh()
+        if self.current_drawing is None:
+            self.info_label.setText(f'Found {self.file_model.total} drawing(s)')
+        elif self.current_file in paths:
+            # The drawing on screen was rewritten; show the new version
+            index = self.file_list.currentIndex()
+            if self.file_model.name(index.row()) == os.path.basename(self.current_file):
+                self.load_drawing(index)
                 
-            self.canvas.load_drawing(data)
-            self.current_file = filepath
-            self.convert_btn.setEnabled(True)
-            self.export_svg_btn.setEnabled(True)
-            
-            # Update info
-            num_strokes = len(data.get('strokes', []))
-            timestamp = data.get('timestamp', 'Unknown')
-            self.info_label.setText(f'{filename}\n{num_strokes} strokes | {timestamp}')
+    def on_catalog_failed(self, error):
+        self.finish_reconcile()
+        self.info_label.setText(f'Catalog error: {error}')
+        
+    def finish_reconcile(self):
+        self.reconcile_running = False
+        if self.reconcile_again:
+            self.reconcile_again = False
+            self.reconcile_catalog()
             
-        except Exception as e:
+    def load_drawing(self, index, previous=None):
+        """Load and display selected drawing in the background"""
+        if not index.isValid():
+            return
+        name = self.file_model.name(index.row())
+        filepath = os.path.join(self.sew_folder, name)
+        
+        try:
+            key = file_key(filepath)
+        except OSError as e:
             QMessageBox.critical(self, 'Error', f'Failed to load file:\n{e}')
-            
-    def convert_to_pes(self):
-        """Convert current drawing to PES embroidery format"""
-        if not self.current_file:
             return
             
-        try:
-            # Load JSON data
-            with open(self.current_file, 'r') as f:
-                data = json.load(f)
+        self.wanted_key = key
+        
+        # Drop loads for drawings that are no longer selected or adjacent
+        row = index.row()
+        keep = {filepath} | set(self.neighbour_paths(row))
+        for pending_key, loader in list(self.pending_loads.items()):
+            if pending_key[0] not in keep:
+                loader.cancel()
+                self.load_pool.tryTake(loader)
+                del self.pending_loads[pending_key]
                 
-            # Create embroidery pattern
-            pattern = pystitch.EmbPattern()
-            
-            # Scaling factor (divide by 4 for reasonable embroidery size)
-            # 1 unit in pystitch = 0.1mm
-            scale = 0.25
+        drawing = self.drawing_cache.get(key)
+        if drawing is not None:
+            self.show_drawing(drawing)
+        else:
+            self.info_label.setText(f'Loading {name}...')
+            self.start_load(key)
             
-            # Convert each stroke
-            for stroke in data.get('strokes', []):
-                coords = stroke['coordinates']
-                color = stroke['color']
-                
-                if len(coords) < 2:
-                    continue  # Skip single points
-                    
-                # Scale coordinates
-                scaled_coords = [(x * scale, y * scale) for x, y in coords]
+        self.prefetch_neighbours(row)
+        
+    def neighbour_paths(self, row):
+        """Paths of the list rows just above and below row"""
+        paths = []
+        for neighbour in (row - 1, row + 1):
+            name = self.file_model.name(neighbour)
+            if name is not None:
+                paths.append(os.path.join(self.sew_folder, name))
+        return paths
+        
+    def prefetch_neighbours(self, row):
+        """Warm the cache with the drawings around the selection"""
+        for filepath in self.neighbour_paths(row):
+            try:
+                key = file_key(filepath)
+            except OSError:
+                continue
+            if key not in self.drawing_cache:
+                self.start_load(key)
                 
-                # Add to pattern
-                pattern.add_block(scaled_coords, color)
+    def start_load(self, key):
+        """Queue a background parse of key unless one is already running"""
+        if key in self.pending_loads:
+            return
+        loader = DrawingLoader(key)
+        loader.signals.loaded.connect(self.on_drawing_loaded)
+        loader.signals.failed.connect(self.on_drawing_failed)
+        self.pending_loads[key] = loader
+        self.load_pool.start(loader)
+        
+    def on_drawing_loaded(self, key, drawing):
+        """Cache a parsed drawing and show it if it is still selected"""
+        self.pending_loads.pop(key, None)
+        self.drawing_cache.put(key, drawing)
+        if key == self.wanted_key:
+            self.show_drawing(drawing)
             
-            # Generate output filename
-            base_name = os.path.splitext(os.path.basename(self.current_file))[0]
-            default_name = f'{base_name}.pes'
+    def on_drawing_failed(self, key, error):
+        """Report a failed load for the selected drawing"""
+        self.pending_loads.pop(key, None)
+        if key == self.wanted_key:
+            self.info_label.setText(f'Failed to load {os.path.basename(key[0])}')
+            QMessageBox.critical(self, 'Error', f'Failed to load file:\n{error}')
             
-            # Save dialog
-            output_file, _ = QFileDialog.getSaveFileName(
-                self, 'Save PES File', default_name, 'PES Files (*.pes)'
-            )
+    def show_drawing(self, drawing):
+        """Display a parsed drawing and enable the export buttons"""
+        self.canvas.load_drawing(drawing)
+        self.current_drawing = drawing
+        self.current_file = drawing.path
+        self.convert_btn.setEnabled(self.export_worker is None)
+        self.export_svg_btn.setEnabled(self.export_worker is None)
+        self.export_all_btn.setEnabled(self.export_worker is None)
+        
+        # Update info
+        self.info_label.setText(f'{drawing.filename}\n{drawing.summary()}')
+        
+    def convert_to_pes(self):
+        """Convert current drawing to PES embroidery format"""
+        if not self.current_drawing:
+            return
             
-            if output_file:
-                # Write PES file with settings
-                pystitch.write_pes(pattern, output_file, {
-                    'max_stitch': 120,
-                    'tie_on': True,
-                    'tie_off': True
-                })
-                
-                QMessageBox.information(
-                    self, 'Success', 
-                    f'Successfully converted to PES!\n\nSaved to:\n{output_file}'
-                )
-                
-        except Exception as e:
-            QMessageBox.critical(self, 'Error', f'Failed to convert:\n{e}')
+        # Generate output filename
+        default_name = f'{self.current_drawing.base_name}.pes'
+        
+        # Save dialog
+        output_file, _ = QFileDialog.getSaveFileName(
+            self, 'Save PES File', default_name, 'PES Files (*.pes)'
+        )
+        
+        if output_file:
+            self.start_export({'pes': output_file})
             
     def export_svg(self):
         """Export current drawing to SVG format"""
-        if not self.current_file:
+        if not self.current_drawing:
             return
             
-        try:
-            # Load JSON data
-            with open(self.current_file, 'r') as f:
-                data = json.load(f)
-                
-            # Create embroidery pattern
-            pattern = pystitch.EmbPattern()
+        # Generate output filename
+        default_name = f'{self.current_drawing.base_name}.svg'
+        
+        # Save dialog
+        output_file, _ = QFileDialog.getSaveFileName(
+            self, 'Save SVG File', default_name, 'SVG Files (*.svg)'
+        )
+        
+        if output_file:
+            self.start_export({'svg': output_file})
             
-            scale = 0.25
+    def export_all(self):
+        """Export current drawing to every supported format at once"""
+        if not self.current_drawing:
+            return
             
-            # Convert each stroke
-            for stroke in data.get('strokes', []):
-                coords = stroke['coordinates']
-                color = stroke['color']
-                
-                if len(coords) < 2:
-                    continue
-                    
-                scaled_coords = [(x * scale, y * scale) for x, y in coords]
-                pattern.add_block(scaled_coords, color)
+        folder = QFileDialog.getExistingDirectory(
+            self, 'Export All Formats To', os.path.dirname(self.current_drawing.path)
+        )
+        
+        if folder:
+            base_name = self.current_drawing.base_name
+            self.start_export({fmt: os.path.join(folder, f'{base_name}.{fmt}')
+                               for fmt in WRITERS})
             
-            # Generate output filename
-            base_name = os.path.splitext(os.path.basename(self.current_file))[0]
-            default_name = f'{base_name}.svg'
+    def start_export(self, targets):
+        """Run an export of {format: file} in the background"""
+        worker = ExportWorker(self.current_drawing, targets)
+        worker.signals.progress.connect(self.on_export_progress)
+        worker.signals.finished.connect(self.on_export_finished)
+        worker.signals.failed.connect(self.on_export_failed)
+        worker.signals.cancelled.connect(self.on_export_cancelled)
+        self.export_worker = worker
+        
+        self.convert_btn.setEnabled(False)
+        self.export_svg_btn.setEnabled(False)
+        self.export_all_btn.setEnabled(False)
+        self.export_progress.setRange(0, 0)  # Busy until the first block
+        self.export_progress.setVisible(True)
+        self.cancel_export_btn.setEnabled(True)
+        self.cancel_export_btn.setVisible(True)
+        
+        self.export_pool.start(worker)
+        
+    def cancel_export(self):
+        """Cancel the running export"""
+        if self.export_worker:
+            self.export_worker.cancel()
+            self.cancel_export_btn.setEnabled(False)
             
-            # Save dialog
-            output_file, _ = QFileDialog.getSaveFileName(
-                self, 'Save SVG File', default_name, 'SVG Files (*.svg)'
-            )
+    def on_export_progress(self, done, total):
+        """Update the progress bar from the export worker"""
+        self.export_progress.setRange(0, total)
+        self.export_progress.setValue(done)
+        
+    def end_export(self):
+        """Hide the progress controls and re-enable the export buttons"""
+        self.export_worker = None
+        self.export_progress.setVisible(False)
+        self.cancel_export_btn.setVisible(False)
+        self.convert_btn.setEnabled(self.current_drawing is not None)
+        self.export_svg_btn.setEnabled(self.current_drawing is not None)
+        self.export_all_btn.setEnabled(self.current_drawing is not None)
+        
+    def on_export_finished(self, targets, timings, report):
+        """Report a completed export with the time each format took"""
+        self.end_export()
+        if list(targets) == ['pes']:
+            message = 'Successfully converted to PES!'
+        elif len(targets) == 1:
+            message = f'Successfully exported to {next(iter(targets)).upper()}!'
+        else:
+            message = f'Successfully exported {len(targets)} formats!'
             
-            if output_file:
-                pystitch.write_svg(pattern, output_file)
-                
-                QMessageBox.information(
-                    self, 'Success', 
-                    f'Successfully exported to SVG!\n\nSaved to:\n{output_file}'
-                )
-                
-        except Exception as e:
-            QMessageBox.critical(self, 'Error', f'Failed to export:\n{e}')
-
+        lines = [f'Pattern: {timings["build"]:.2f}s']
+        for fmt, output_file in targets.items():
+            lines.append(f'{fmt.upper()}: {timings[fmt]:.2f}s  {output_file}')
+        lines.extend(describe_report(report))
+        details = '\n'.join(lines)
+        QMessageBox.information(
+            self, 'Success', 
+            f'{message}\n\nSaved to:\n{details}'
+        )
+        
+    def on_export_failed(self, error):
+        """Report a failed export"""
+        self.end_export()
+        QMessageBox.critical(self, 'Error', f'Failed to export:\n{error}')
+        
+    def on_export_cancelled(self):
+        """Note a cancelled export; nothing was written"""
+        self.end_export()
+        self.info_label.setText('Export cancelled')
+        
 def main():
     app = QApplication(sys.argv)
     viewer = SewViewer()